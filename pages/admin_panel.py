@@ -1,46 +1,48 @@
+import os
 import streamlit as st
-import psycopg2
 import time
-
-# 🔹 PostgreSQL Database Connection
-def connect_db():
-    return psycopg2.connect(
-        dbname=st.secrets["database"]["DB_NAME"],
-        user=st.secrets["database"]["DB_USER"],
-        password=st.secrets["database"]["DB_PASSWORD"],
-        host=st.secrets["database"]["DB_HOST"],
-        port=st.secrets["database"]["DB_PORT"]
-    )
+import tempfile
+from utils.config import get_setting
+from utils.db import get_connection
+from utils.migrations import ensure_schema
+from utils.semantic_cache import get_semantic_cache
+from utils.transfer import TABLES, export_table
+from utils.jobs import job_counts, list_jobs, requeue_failed_jobs
+
+# 🔹 PostgreSQL connections come from the shared pool in utils/db.py
 # Function to fetch all users in uppercase
 def fetch_users():
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, UPPER(username) FROM users")  # Convert to uppercase
-    users = cursor.fetchall()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id, UPPER(username) FROM users")  # Convert to uppercase
+        users = cursor.fetchall()
     return users
 
 # Function to get total user count
 def get_user_count():
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM users")
-    user_count = cursor.fetchone()[0]
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM users")
+        user_count = cursor.fetchone()[0]
     return user_count
 
 # Function to delete a user
 def delete_user(user_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
     st.success(f"✅ User with ID {user_id} deleted successfully!")
     st.rerun()  # Refresh the page to update the user list
 
+# Exports are written to a temp file; only this much is offered for in-app download
+EXPORT_MAX_MB = int(get_setting("admin", "EXPORT_MAX_MB", 50))
+
+# Remove the prepared export file (after download, when replaced, or on logout)
+def discard_export():
+    export_file = st.session_state.pop("export_file", None)
+    if export_file and os.path.exists(export_file[0]):
+        os.remove(export_file[0])
+
 # Hide sidebar & apply custom styling
 st.set_page_config(page_title="Admin Panel", page_icon="⚙️", layout="wide")
+ensure_schema()  # Creates tables/indexes on first run, no-op afterwards
 
 st.markdown(
     """
@@ -194,6 +196,7 @@ with col2:
 with col3:
     if st.button("🚪 Logout", key="logout", help="Log Out", use_container_width=True):
         st.session_state["admin_logged_in"] = False
+        discard_export()
         st.session_state.clear()
         # st.success("✅ You have been logged out. Redirecting to login...")
         time.sleep(2)
@@ -217,6 +220,14 @@ if st.session_state["current_page"] == "home":
     with col2:
         st.markdown('<div class="dashboard-card">📂 Recent Activity: No new updates</div>', unsafe_allow_html=True)
 
+    # Semantic question cache stats (this server process)
+    cache_stats = get_semantic_cache().metrics()
+    st.markdown(
+        f'<div class="dashboard-card">🧠 Semantic Cache: {cache_stats["hits"]} hits / '
+        f'{cache_stats["misses"]} misses ({cache_stats["hit_rate"]:.0%} hit rate)</div>',
+        unsafe_allow_html=True,
+    )
+
     st.markdown("---")
 
     # Quick Links
@@ -236,6 +247,73 @@ if st.session_state["current_page"] == "home":
         if st.button("🔄 Refresh Dashboard", use_container_width=True):
             st.rerun()
 
+    st.markdown("---")
+
+    # Background ingestion queue (see utils/jobs.py)
+    st.subheader("Ingestion Jobs ⚙️")
+    counts = job_counts()
+    for column, (state, count) in zip(st.columns(len(counts)), counts.items()):
+        column.markdown(f'<div class="dashboard-card">{state.title()}: {count}</div>', unsafe_allow_html=True)
+
+    recent_jobs = list_jobs(limit=20)
+    if recent_jobs:
+        st.dataframe(
+            [{key: job[key] for key in ("id", "file_name", "user_id", "status", "progress", "chunk_count",
+                                        "attempts", "worker", "error", "created_at", "finished_at")}
+             for job in recent_jobs],
+            use_container_width=True,
+            hide_index=True,
+        )
+    if counts["failed"] and st.button("🔁 Requeue Failed Jobs"):
+        st.success(f"✅ Requeued {requeue_failed_jobs()} job(s).")
+
+    st.markdown("---")
+
+    # Data Export (Postgres COPY streamed into a gzip temp file, then offered for download)
+    st.subheader("Data Export 📦")
+    col1, col2, col3 = st.columns([2, 2, 1])
+    export_name = col1.selectbox("Table", list(TABLES))
+    export_user = col2.text_input("User ID (optional)", placeholder="All users")
+    col3.markdown("<br>", unsafe_allow_html=True)
+
+    if col3.button("📤 Prepare Export", use_container_width=True):
+        if export_user.strip() and not export_user.strip().isdigit():
+            st.error("❌ User ID must be a number.")
+        else:
+            discard_export()
+            with tempfile.NamedTemporaryFile(suffix=".csv.gz", delete=False) as f:
+                export_table(export_name, f, int(export_user) if export_user.strip() else None)
+            export_mb = os.path.getsize(f.name) / (1024 * 1024)
+            if export_mb > EXPORT_MAX_MB:
+                os.remove(f.name)
+                st.warning(
+                    f"⚠️ This export is {export_mb:.0f} MB, above the {EXPORT_MAX_MB} MB in-app limit. "
+                    f"Use `python -m utils.transfer export {export_name} {export_name}.csv.gz` instead."
+                )
+            else:
+                # The download is offered on its own page so dashboard reruns don't reload the file
+                st.session_state["export_file"] = (f.name, f"{export_name}.csv.gz")
+                st.session_state["current_page"] = "export"
+                st.rerun()
+
+elif st.session_state["current_page"] == "export":
+    st.title("📦 Data Export")
+    if "export_file" not in st.session_state:
+        st.session_state["current_page"] = "home"
+        st.rerun()
+
+    export_path, export_filename = st.session_state["export_file"]
+    st.info(f"ℹ️ {export_filename} is ready ({os.path.getsize(export_path) / (1024 * 1024):.1f} MB).")
+    col1, col2 = st.columns(2)
+    with open(export_path, "rb") as f:
+        if col1.download_button("⬇️ Download " + export_filename, f, file_name=export_filename,
+                                mime="application/gzip", use_container_width=True):
+            discard_export()
+    if col2.button("⬅️ Back to Dashboard", use_container_width=True):
+        discard_export()
+        st.session_state["current_page"] = "home"
+        st.rerun()
+
 elif st.session_state["current_page"] == "users":
     st.title("👥 Manage Users")
     st.subheader("User List")
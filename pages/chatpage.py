@@ -1,18 +1,25 @@
 # ======================= Import Section =======================
 import streamlit as st
-import psycopg2
 import os
 import time
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-# from langchain.vectorstores import FAISS    #use this for local
-from langchain_community.vectorstores import FAISS    # type: ignore     #use this for deploying on streamlit and remove type ignore
-from langchain.chains.question_answering import load_qa_chain
-from langchain.prompts import PromptTemplate
-from PyPDF2 import PdfReader
-import pandas as pd
-from io import StringIO
-from docx import Document
+from utils.db import get_connection
+from utils.history import PAGE_SIZE, fetch_history
+from utils.history_writer import get_history_writer
+from utils.migrations import ensure_schema
+from utils.index_cache import document_key, get_index_cache
+from utils.extraction import count_document_pieces, extraction_key, iter_document_text
+from utils.ingestion import build_index_pipelined
+from utils.jobs import background_ingestion_enabled, enqueue_job, get_job, list_jobs, requeue_job
+from utils.answer_cache import get_cached_answer, invalidate_document, precompute_answers, store_answer
+from utils.semantic_cache import get_semantic_cache
+from utils.qa import stream_packed_answer
+from utils.context_packer import pack_context
+from utils.bm25 import hybrid_search, store_texts
+from utils.summarizer import is_summary_question, stream_summary_answer
+from utils.table_query import answer_table_question, is_tabular, load_tables
+from utils.resources import get_embeddings, get_llm, get_text_splitter
+from utils.workspace import (WorkspaceBusy, add_to_library, delete_workspace, get_workspace, list_documents,
+                             scope_key, superseded_documents)
 
 # ======================= Streamlit Config, API & PostgreSQL Database Connection =======================
 
@@ -22,36 +29,21 @@ st.title("📝 ChatDocs")
 # 🔹 Load API Key from Streamlit Secrets
 os.environ["GOOGLE_API_KEY"] = st.secrets["general"]["GOOGLE_API_KEY"]
 
-# 🔹 PostgreSQL Database Connection
-def connect_db():
-    return psycopg2.connect(
-        dbname=st.secrets["database"]["DB_NAME"],
-        user=st.secrets["database"]["DB_USER"],
-        password=st.secrets["database"]["DB_PASSWORD"],
-        host=st.secrets["database"]["DB_HOST"],
-        port=st.secrets["database"]["DB_PORT"]
-    )
+# 🔹 PostgreSQL connections come from the shared pool in utils/db.py
+ensure_schema()  # Creates tables/indexes on first run, no-op afterwards
 
 
 # ======================= Delete Chat =======================
 
 # 🔹 Delete Chat History Function
 def delete_chat_history(user_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM chat_history WHERE user_id = %s", (user_id,))
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM chat_history WHERE user_id = %s", (user_id,))
 
 # 🔹 Function to Delete Chat History for a Specific PDF
 def delete_chat_history_pdf(user_id, pdf_name):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM chat_history WHERE user_id = %s AND pdf_name = %s", (user_id, pdf_name))
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM chat_history WHERE user_id = %s AND pdf_name = %s", (user_id, pdf_name))
 
 
 # ======================= User Account Management =======================
@@ -59,11 +51,13 @@ def delete_chat_history_pdf(user_id, pdf_name):
 # 🔹 Delete User Account
 def delete_account(user_id):
     try:
-        with connect_db() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM chat_history WHERE user_id = %s", (user_id,))
-                cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-            conn.commit()
+        # Their cached answers go too (read before the documents rows are deleted with the user)
+        doc_hashes = set(list_documents(user_id)) | superseded_documents(user_id)
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM chat_history WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        delete_workspace(user_id)
+        invalidate_document(*doc_hashes)
         return True
     except Exception as e:
         st.error(f"❌ Error deleting account: {e}")
@@ -71,12 +65,9 @@ def delete_account(user_id):
 
 def get_admin_username(user_id):
     """Fetch the admin's username from the users table."""
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT username FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT username FROM users WHERE id = %s", (user_id,))
+        user = cursor.fetchone()
     
     return user[0].upper() if user else None
 
@@ -177,30 +168,29 @@ st.session_state["current_page"] = "homepage"
 st.sidebar.title("📜 Chat History")
 
 if st.session_state["user_id"]:
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT pdf_name FROM chat_history WHERE user_id = %s", (st.session_state["user_id"],))
-    pdfs = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    # 🔹 Document list + newest page of chats in a single query
+    history = fetch_history(st.session_state["user_id"], st.session_state.get("history_pdf"))
+    pdfs = history["documents"]
 
     if pdfs:
         selected_pdf = st.sidebar.selectbox(
             "Select a Document",  # Keep a valid label
-            [pdf[0] for pdf in pdfs],
+            pdfs,
+            index=pdfs.index(history["pdf_name"]),
+            key="history_pdf",
             label_visibility="collapsed"  # Hides the label but avoids warnings
         )
 
-        conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT question, answer, timestamp FROM chat_history WHERE user_id = %s AND pdf_name = %s ORDER BY timestamp DESC",
-            (st.session_state["user_id"], selected_pdf),
-        )
-        chats = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
+        chats = history["chats"]
+        next_cursor = history["next_cursor"]
+
+        # 🔹 Older pages the user already loaded for this document, refetched from where page 1 ends
+        #    now: a new question shifts page 1, and a row it pushed out must not fall between pages
+        older = st.session_state.get("history_older")
+        if older and older["pdf_name"] == selected_pdf and next_cursor:
+            page = fetch_history(st.session_state["user_id"], selected_pdf, next_cursor, limit=older["count"])
+            chats = chats + page["chats"]
+            next_cursor = page["next_cursor"]
 
         if chats:
             for chat in chats:
@@ -210,9 +200,17 @@ if st.session_state["user_id"]:
         else:
             st.sidebar.info("No chats found for this PDF.")
 
+        if next_cursor and st.sidebar.button("⬇️ Load more"):
+            st.session_state["history_older"] = {
+                "pdf_name": selected_pdf,
+                "count": len(chats) - len(history["chats"]) + PAGE_SIZE,
+            }
+            st.rerun()
+
         # 🔹 Show Delete Chat History for Selected PDF only if `selected_pdf` exists
         if st.sidebar.button(f"🗑️ Delete Chat for '{selected_pdf}'"):
             delete_chat_history_pdf(st.session_state["user_id"], selected_pdf)
+            st.session_state.pop("history_older", None)
             st.sidebar.success(f"✅ Chat history for '{selected_pdf}' deleted!")
             st.rerun()
     else:
@@ -221,6 +219,7 @@ if st.session_state["user_id"]:
     # 🔹 Always show "Delete All Chat History" button
     if pdfs and st.sidebar.button("🗑️ Delete All Chat History"):
         delete_chat_history(st.session_state["user_id"])
+        st.session_state.pop("history_older", None)
         st.sidebar.success("✅ Chat history deleted!")
         st.rerun()
 
@@ -323,62 +322,134 @@ st.markdown(
 )
 
 
-# ======================= Extraction of text =======================
-
-# 🔹 Extract Text from PDF
-def extract_text_from_pdf(uploaded_file):
-    reader = PdfReader(uploaded_file)
-    text = "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
-    return text
-
-def extract_text_from_docx(uploaded_file):
-    doc = Document(uploaded_file)
-    return "\n".join([para.text for para in doc.paragraphs])
-
-def extract_text_from_csv(uploaded_file):
-    df = pd.read_csv(uploaded_file)
-    return df.to_string()
-
-def extract_text_from_xlsx(uploaded_file):
-    df = pd.read_excel(uploaded_file)
-    return df.to_string()
+# ======================= File Upload Section =======================
 
-def extract_text_from_txt(uploaded_file):
-    return StringIO(uploaded_file.getvalue().decode("utf-8")).read()
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+EMBEDDING_MODEL = "models/embedding-001"
+LLM_MODEL = "gemini-1.5-flash"
+RETRIEVAL_CANDIDATES = 6
+CONTEXT_TOKEN_BUDGET = 1200
 
+# 🔹 Chunks already embedded for any document/user are served from the local cache,
+#    misses go out in concurrent, rate-limited batches (built once per process)
+embeddings = get_embeddings(EMBEDDING_MODEL)
 
-# ======================= File Upload Section =======================
+# 🔹 Logged-in users keep a persistent library of everything they uploaded
+workspace = None
+library = {}
+if st.session_state["user_id"]:
+    workspace = get_workspace(st.session_state["user_id"], embeddings)
+    in_shard = workspace.doc_hashes()
+    library = {doc_hash: name for doc_hash, name in list_documents(st.session_state["user_id"]).items()
+               if doc_hash in in_shard}
+    # Uploads finished by the background worker after the user left the page still join the library
+    # (oldest first, as new versions where they replace one), unless a later version already replaced them
+    if background_ingestion_enabled():
+        skip = in_shard | superseded_documents(st.session_state["user_id"])
+        for job in reversed(list_jobs(limit=20, user_id=st.session_state["user_id"], status="done")):
+            finished_store = get_index_cache().load(job["doc_key"], embeddings) if job["doc_key"] not in skip else None
+            if finished_store is not None:
+                try:
+                    library, _ = add_to_library(workspace, st.session_state["user_id"], library,
+                                                job["doc_key"], job["file_name"], finished_store)
+                except WorkspaceBusy:
+                    break  # Picked up on a later visit, once the bulk load is done
+                skip.add(job["doc_key"])
 
 uploaded_file = st.file_uploader("📂 Upload a document", type=["pdf", "docx", "csv", "xlsx", "txt"])
 
-if uploaded_file is None:
+if uploaded_file is None and not library:
     st.warning("⚠️ Please upload a document to proceed.")
     st.stop()
 
-file_type = uploaded_file.type
-if "pdf" in file_type:
-    document_text = extract_text_from_pdf(uploaded_file)
-elif "word" in file_type or "docx" in uploaded_file.name:
-    document_text = extract_text_from_docx(uploaded_file)
-elif "csv" in file_type:
-    document_text = extract_text_from_csv(uploaded_file)
-elif "excel" in file_type or "xlsx" in uploaded_file.name:
-    document_text = extract_text_from_xlsx(uploaded_file)
-elif "text" in file_type or "txt" in uploaded_file.name:
-    document_text = extract_text_from_txt(uploaded_file)
-else:
-    st.error("❌ Unsupported file type.")
+
+# ======================= Faiss operations & QnA =======================
+
+index_key = None
+vector_store = None
+index_built = False
+
+if uploaded_file is not None:
+    # 🔹 Reuse the saved index for this exact file + splitter settings, only embed on a miss
+    index_cache = get_index_cache()
+    index_key = document_key(uploaded_file.getvalue(), CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL,
+                             extraction_key(uploaded_file))
+    vector_store = index_cache.load(index_key, embeddings)
+
+# 🔹 With a background worker running, the upload is queued and this page only shows the job status
+if uploaded_file is not None and vector_store is None and background_ingestion_enabled():
+    job = get_job(index_key)
+    if job is None or job["status"] == "done":
+        # New document, or its finished index was evicted from the cache since
+        job = enqueue_job(st.session_state["user_id"], uploaded_file, index_key, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL)
+    if job["status"] == "failed":
+        st.error(f"❌ Processing failed: {job['error']}")
+        if st.button("🔁 Retry"):
+            requeue_job(job["id"])
+            st.rerun()
+    else:
+        label = "⏳ Waiting for a worker..." if job["status"] == "queued" else f"⏳ Processing document ({job['progress']:.0%})..."
+        st.progress(job["progress"], text=label)
+        time.sleep(2)
+        st.rerun()
     st.stop()
 
+if uploaded_file is not None and vector_store is None:
+    document_pieces = iter_document_text(uploaded_file)
+    if document_pieces is None:
+        st.error("❌ Unsupported file type.")
+        st.stop()
 
-# ======================= Faiss operations & QnA =======================
+    # 🔹 Extract → split → embed → index run as overlapping stages
+    text_splitter = get_text_splitter(CHUNK_SIZE, CHUNK_OVERLAP)
+    total_pieces = count_document_pieces(uploaded_file)
+    progress_bar = st.progress(0.0, text="⏳ Processing document...")
+
+    def show_progress(pieces_done, chunks_indexed):
+        progress_bar.progress(min(pieces_done / total_pieces, 1.0), text=f"⏳ Indexed {chunks_indexed} chunks...")
+
+    vector_store = build_index_pipelined(document_pieces, text_splitter, embeddings, on_progress=show_progress)
+    progress_bar.empty()
+
+    if vector_store is None:
+        st.error("❌ No text could be extracted from this document.")
+        st.stop()
+    index_cache.save(index_key, vector_store)
+    index_built = True
 
-# 🔹 Text Splitting & Embedding
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-texts = text_splitter.split_text(document_text)
+# 🔹 Keyword index over the same chunks, fused with vector search at question time
+bm25 = index_cache.load_bm25(index_key, vector_store) if vector_store is not None else None
+
+# 🔹 Add the upload to the user's library once, so it can be asked later without re-uploading
+#    (as a new version of a same-name document it mostly matches, see add_to_library)
+if workspace is not None and uploaded_file is not None and index_key not in library:
+    try:
+        library, changes = add_to_library(workspace, st.session_state["user_id"], library, index_key, uploaded_file.name, vector_store)
+        if changes is not None:
+            kept, added, removed = changes
+            st.info(f"🔄 Updated to a new version: {added} chunks added, {removed} removed, {kept} unchanged.")
+    except WorkspaceBusy:
+        # Retried on the next rerun; meanwhile the upload can be asked on its own
+        st.info("📦 Your library is being bulk loaded, this document will be added to it once that finishes.")
+        library = {index_key: uploaded_file.name, **library}
+
+# 🔹 Choose which documents to ask: the current upload by default, or any from the library
+if library:
+    selected_docs = st.multiselect(
+        "📚 Ask across your documents",
+        list(library),
+        default=[index_key] if index_key else list(library),
+        format_func=lambda doc_hash: library[doc_hash],
+    )
+    if not selected_docs:
+        st.info("ℹ️ Select at least one document to ask questions.")
+        st.stop()
+else:
+    selected_docs = [index_key]
 
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-vector_store = FAISS.from_texts(texts, embeddings)
+scope = scope_key(selected_docs)
+scope_name = ", ".join(library.get(doc_hash, uploaded_file.name if uploaded_file else doc_hash) for doc_hash in selected_docs)
 
 # 🔹 Question Answering
 st.subheader("Ask a Question from the Docs:")
@@ -388,6 +459,45 @@ def process_question(question):
     # Replace this with your Gemini API call
     return question  # Placeholder response
 
+semantic_cache = get_semantic_cache()
+
+# 🔹 Whole-document questions go through the cached map-reduce summaries of every chunk
+def stream_document_summary(question):
+    if vector_store is not None and selected_docs == [index_key]:
+        documents = [(scope_name, store_texts(vector_store))]
+    else:
+        documents = [(library[doc_hash], workspace.document_texts(doc_hash)) for doc_hash in selected_docs]
+    return stream_summary_answer(get_llm(LLM_MODEL), LLM_MODEL, documents, question)
+
+# 🔹 Retrieve candidate chunks (from the upload itself or the library shard), pack the best
+#    non-overlapping spans into the token budget and stream Gemini's answer
+def stream_answer(question, question_vector=None):
+    if is_summary_question(question):
+        return stream_document_summary(question)
+    # Spreadsheet aggregations are computed from the table itself when the question maps to a query plan
+    if uploaded_file is not None and selected_docs == [index_key] and is_tabular(uploaded_file):
+        table_answer = answer_table_question(get_llm(LLM_MODEL), index_key, load_tables(index_key, uploaded_file), question)
+        if table_answer is not None:
+            return iter([table_answer])
+    if vector_store is not None and selected_docs == [index_key]:
+        results = hybrid_search(vector_store, bm25, question, k=RETRIEVAL_CANDIDATES, with_positions=True,
+                                query_vector=question_vector)
+    else:
+        results = workspace.similarity_search(question, selected_docs, k=RETRIEVAL_CANDIDATES, with_positions=True,
+                                              query_vector=question_vector)
+    hits = [(doc.metadata.get("doc_hash", index_key), doc.metadata.get("doc_name", scope_name),
+             doc.metadata.get("chunk", position), doc.page_content, score)
+            for doc, position, score in results]
+    packed, context_tokens = pack_context(hits, CONTEXT_TOKEN_BUDGET)
+    return stream_packed_answer(get_llm(LLM_MODEL), packed, context_tokens, question)
+
+# 🔹 Full answer (used off-screen), remembered for similar questions
+def answer_question(question):
+    question_vector = semantic_cache.embed(question, embeddings)
+    answer = "".join(stream_answer(question, question_vector))
+    semantic_cache.add(scope, question_vector, answer)
+    return answer
+
 # ======================= Predefined Questions for PDFs =======================
 
 predefined_questions = [
@@ -400,6 +510,12 @@ predefined_questions = [
     "Explain the methodology used in this document."
 ]
 
+# 🔹 Warm the answer cache for the quick questions right after a new upload
+#    (not the whole-document ones: a map-reduce over every chunk is only worth it when asked)
+if index_built and selected_docs == [index_key]:
+    precompute_answers(index_key, [question for question in predefined_questions if not is_summary_question(question)],
+                       answer_question, LLM_MODEL)
+
 # st.subheader("🔹 Quick Questions") 
 selected_question = st.radio("Select a question:", predefined_questions, index=None)
 
@@ -414,21 +530,27 @@ if user_question:
     st.write("💡 Question:", response)
 
 if user_question:
-    docs = vector_store.similarity_search(user_question)
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
-    chain = load_qa_chain(llm, chain_type="stuff")
-    answer = chain.run(input_documents=docs, question=user_question)
+    # 🔹 Repeat questions on the same document are served from the answer cache
+    answer = get_cached_answer(scope, user_question, LLM_MODEL)
+    cached = answer is not None
+    if answer is None:
+        # 🔹 Near-duplicates ("give me a summary" vs "summarize this") reuse an earlier answer
+        question_vector = semantic_cache.embed(user_question, embeddings)
+        similar = semantic_cache.lookup(scope, question_vector)
+        if similar:
+            answer = similar[0]
 
     # 🔹 Display Answer
-    st.write("💡 **Answer:**", answer)
-
-    # 🔹 Save Q&A to Database
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO chat_history (user_id, pdf_name, question, answer) VALUES (%s, %s, %s, %s)",
-        (st.session_state["user_id"], uploaded_file.name, user_question, answer),
-    )
-    conn.commit()
-    cursor.close()
-    conn.close()
\ No newline at end of file
+    if answer is not None:
+        st.write("💡 **Answer:**", answer)
+    else:
+        # 🔹 Show tokens as they arrive instead of waiting for the whole answer
+        st.write("💡 **Answer:**")
+        answer = st.write_stream(stream_answer(user_question, question_vector))
+        semantic_cache.add(scope, question_vector, answer)
+
+    if not cached:
+        store_answer(scope, user_question, LLM_MODEL, answer)
+
+    # 🔹 Save Q&A to Database (queued, written in batches by a background thread)
+    get_history_writer().submit(st.session_state["user_id"], scope_name, user_question, answer)
\ No newline at end of file
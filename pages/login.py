@@ -6,19 +6,14 @@ import re  # Import regex for email validation
 import smtplib
 import random
 from email.mime.text import MIMEText
+from utils.db import get_connection
+from utils.migrations import ensure_schema
 # Streamlit Config
 st.set_page_config(page_title="Login", page_icon="🔑", initial_sidebar_state="collapsed")
 
 
-# Function to connect to PostgreSQL
-def connect_db():
-    return psycopg2.connect(
-        dbname=st.secrets["database"]["DB_NAME"],
-        user=st.secrets["database"]["DB_USER"],
-        password=st.secrets["database"]["DB_PASSWORD"],
-        host=st.secrets["database"]["DB_HOST"],
-        port=st.secrets["database"]["DB_PORT"]
-    )
+# PostgreSQL connections come from the shared pool in utils/db.py
+ensure_schema()  # Creates tables/indexes on first run, no-op afterwards
 
 # ======================= Email Handling =======================
 
@@ -49,10 +44,9 @@ def send_reset_email(email, otp):
     return False
 
 def forgot_password(email):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE email=%s", (email,))
-    user = cursor.fetchone()
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM users WHERE email=%s", (email,))
+        user = cursor.fetchone()
 
     if user:
         otp = random.randint(100000, 999999)
@@ -69,12 +63,8 @@ def reset_password(email, otp, new_password):
     if "reset_otp" in st.session_state and "reset_email" in st.session_state:
         if st.session_state["reset_otp"] == otp and st.session_state["reset_email"] == email:
             hashed_pw = hash_password(new_password)
-            conn = connect_db()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET password=%s WHERE email=%s", (hashed_pw, email))
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with get_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("UPDATE users SET password=%s WHERE email=%s", (hashed_pw, email))
             return True
     return False
 
@@ -90,12 +80,9 @@ def check_password(plain_password, hashed_password):
 
 # 🔹 Validate User Login
 def validate_user(username, password):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, password FROM users WHERE username=%s", (username,))
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id, password FROM users WHERE username=%s", (username,))
+        user = cursor.fetchone()
     if user and check_password(password, user[1]):
         return user[0]
     return None
@@ -111,21 +98,16 @@ def register_user(username, email, password):
         return "❌ Password cannot be empty!"
 
     hashed_pw = hash_password(password)
-    conn = connect_db()
-    cursor = conn.cursor()
-    
+
     try:
-        cursor.execute(
-            "INSERT INTO users (username, email, password) VALUES (%s, %s, %s)", 
-            (username, email, hashed_pw)
-        )
-        conn.commit()
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO users (username, email, password) VALUES (%s, %s, %s)", 
+                (username, email, hashed_pw)
+            )
         return "✅ Registration successful!"
     except psycopg2.IntegrityError:
         return "❌ Email already registered!"
-    finally:
-        cursor.close()
-        conn.close()
 st.title("🔐 Login to ChatDocs")
 
 
@@ -0,0 +1,236 @@
+import argparse
+import math
+import time
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore    # type: ignore
+from langchain_community.vectorstores import FAISS    # type: ignore
+from langchain_community.vectorstores.utils import DistanceStrategy    # type: ignore
+from utils.config import get_setting
+
+
+# ======================= Index Types =======================
+#
+# flat      exact IndexFlatIP, best for small corpora
+# hnsw      graph index, high recall and fast queries, no training, ~1.5x the memory of flat
+# ivf_flat  inverted lists over k-means cells, trained on a sample, tune with nprobe
+# ivf_pq    IVF with product-quantized codes (dim/8 bytes per vector), for very large corpora
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+FLAT_MAX_VECTORS = 20_000
+HNSW_MAX_VECTORS = 500_000
+TRAIN_SAMPLE_PER_LIST = 64
+# PQ trains 256 centroids per sub-quantizer; below ~39 points per centroid it can't (or shouldn't) train
+PQ_MIN_VECTORS = 256 * 39
+
+
+def choose_index_type(n_vectors, compact=False):
+    if n_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if compact:
+        return "ivf_pq"
+    if n_vectors <= HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf_flat"
+
+
+def configured_index_type(n_vectors):
+    index_type = str(get_setting("vector_index", "TYPE", "auto")).lower()
+    if index_type == "auto":
+        compact = str(get_setting("vector_index", "COMPACT", "false")).lower() in ("true", "1", "yes")
+        return choose_index_type(n_vectors, compact)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type '{index_type}', expected auto or one of {INDEX_TYPES}")
+    return trainable_index_type(index_type, n_vectors)
+
+
+def trainable_index_type(index_type, n_vectors):
+    """`index_type`, or flat when there are too few vectors to train it."""
+    if index_type == "ivf_pq" and n_vectors < PQ_MIN_VECTORS:
+        return "flat"
+    return index_type
+
+
+def unwrap(index):
+    """The index inside an IndexIDMap/IndexIDMap2 wrapper (or the index itself)."""
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+
+def index_type_of(index):
+    if isinstance(unwrap(index), faiss.IndexHNSW):
+        return "hnsw"
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+    return "flat"
+
+
+def _pq_subquantizers(dim):
+    # ~8 dims per 1-byte code, and the count must divide the dimension
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def has_stable_ids(index):
+    """True if labels are caller-assigned ids that survive removals (IDMap wrapper or IVF)."""
+    return isinstance(index, faiss.IndexIDMap) or faiss.try_extract_index_ivf(index) is not None
+
+
+# 🔹 Build, train (on a sample) and fill an inner-product index; vectors must be L2-normalized.
+#    With `ids`, flat/HNSW are wrapped in IndexIDMap2 and IVF uses its native ids, so vectors can
+#    later be removed by id without renumbering the rest.
+def build_index(vectors, index_type="flat", nlist=None, hnsw_m=32, ef_construction=80, seed=0, ids=None):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index_type = trainable_index_type(index_type, n)
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or max(1, min(int(4 * math.sqrt(n)), n // 39 or 1))
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), 8, faiss.METRIC_INNER_PRODUCT)
+        sample_size = min(n, max(nlist * TRAIN_SAMPLE_PER_LIST, 256 * 39))
+        sample = vectors[np.random.default_rng(seed).choice(n, sample_size, replace=False)]
+        index.train(sample)
+        # Hashtable direct map: reconstruct() and remove_ids() keep working
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        raise ValueError(f"Unknown vector index type '{index_type}'")
+
+    if ids is None:
+        index.add(vectors)
+        return index
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    if index_type in ("flat", "hnsw"):
+        index = faiss.IndexIDMap2(index)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+# 🔹 nprobe (IVF) / efSearch (HNSW): higher = better recall, slower queries
+def set_search_params(index, nprobe=None, ef_search=None):
+    nprobe = int(nprobe or get_setting("vector_index", "NPROBE", 16))
+    ef_search = int(ef_search or get_setting("vector_index", "EF_SEARCH", 128))
+    if isinstance(unwrap(index), faiss.IndexHNSW):
+        unwrap(index).hnsw.efSearch = ef_search
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    return index
+
+
+def restore_direct_map(index):
+    # FAISS doesn't serialize the Hashtable direct map, rebuild it after reading an IVF index
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def reconstruct_all(index):
+    if faiss.try_extract_index_ivf(index) is not None:
+        return np.vstack([index.reconstruct(i) for i in range(index.ntotal)]) if index.ntotal else np.empty((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def reconstruct_ids(index, ids):
+    """Vectors stored under `ids` (labels), in that order."""
+    if not len(ids):
+        return np.empty((0, index.d), dtype=np.float32)
+    return index.reconstruct_batch(np.ascontiguousarray(ids, dtype=np.int64))
+
+
+# ======================= LangChain Glue =======================
+
+def make_store(embeddings, index, docs, labels=None):
+    """Wrap a FAISS index whose label labels[i] (default: position i) holds docs[i] as a LangChain vector store."""
+    labels = range(len(docs)) if labels is None else [int(label) for label in labels]
+    ids = [str(label) for label in labels]
+    return FAISS(
+        embeddings,
+        set_search_params(index),
+        InMemoryDocstore(dict(zip(ids, docs))),
+        dict(zip(labels, ids)),
+        normalize_L2=True,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+
+
+# 🔹 Rebuild a store's index as `index_type` with stable ids, keeping the same labels and documents.
+#    PQ codes only approximate the original vectors, so an ivf_pq index is never rebuilt from them.
+def reindex_store(store, index_type, keep_labels=None):
+    if index_type_of(store.index) == "ivf_pq":
+        raise ValueError("Can't rebuild an ivf_pq index from its lossy codes, re-embed the documents instead")
+    labels = sorted(store.index_to_docstore_id if keep_labels is None else keep_labels)
+    vectors = reconstruct_ids(store.index, labels)
+    if store.distance_strategy != DistanceStrategy.MAX_INNER_PRODUCT or not store._normalize_L2:
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    docs = [store.docstore.search(store.index_to_docstore_id[label]) for label in labels]
+    return make_store(store.embeddings, build_index(vectors, index_type, ids=labels), docs, labels)
+
+
+def load_store(folder, embeddings):
+    store = FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True)
+    if store.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        store.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+        store._normalize_L2 = True
+    set_search_params(restore_direct_map(store.index))
+    return store
+
+
+# ======================= Benchmark =======================
+
+def _clustered_vectors(n, dim, rng, clusters=256):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.4 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k vs latency for the supported FAISS index types.")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = _clustered_vectors(args.vectors, args.dim, rng)
+    queries = _clustered_vectors(args.queries, args.dim, rng)
+    _, truth = build_index(data, "flat").search(queries, args.k)
+
+    print(f"{args.vectors} vectors x {args.dim} dims, {args.queries} queries, recall@{args.k}")
+    print(f"{'index':<10} {'param':<14} {'build s':>8} {'MB':>8} {'ms/query':>9} {'recall':>7}")
+    for index_type in INDEX_TYPES:
+        start = time.perf_counter()
+        index = build_index(data, index_type)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        if index_type == "hnsw":
+            settings = [("efSearch", value, {"ef_search": value}) for value in (16, 64, 256)]
+        elif index_type.startswith("ivf"):
+            settings = [("nprobe", value, {"nprobe": value}) for value in (1, 8, 32, 128)]
+        else:
+            settings = [("exact", "-", {})]
+
+        for name, value, params in settings:
+            set_search_params(index, **params)
+            start = time.perf_counter()
+            _, found = index.search(queries, args.k)
+            ms_per_query = (time.perf_counter() - start) * 1000 / args.queries
+            recall = np.mean([len(set(found[i]) & set(truth[i])) / args.k for i in range(args.queries)])
+            print(f"{index_type:<10} {f'{name}={value}':<14} {build_seconds:>8.2f} {size_mb:>8.1f} {ms_per_query:>9.3f} {recall:>7.3f}")
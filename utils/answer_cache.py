@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import re
+import threading
+from utils.config import get_setting
+from utils.db import get_connection
+
+
+# ======================= Answer Cache =======================
+
+# Bump whenever answer generation changes (prompt, retrieval, routing) so old answers stop matching.
+# v2: whole-document questions are answered by map-reduce summaries
+# v3: aggregation questions on spreadsheets are computed from the table
+PROMPT_VERSION = "packed-v3"
+
+_precompute_lock = threading.Lock()
+_precomputing = set()
+
+logger = logging.getLogger(__name__)
+
+
+def _ttl_hours():
+    return float(get_setting("cache", "ANSWER_TTL_HOURS", 168))
+
+
+# 🔹 "Summarize this document." and "  summarize this document " share one cache entry
+def normalize_question(question):
+    return re.sub(r"\s+", " ", question).strip().rstrip("?.!").strip().lower()
+
+
+def question_key(question):
+    return hashlib.md5(normalize_question(question).encode("utf-8")).hexdigest()
+
+
+def get_cached_answer(doc_hash, question, model, prompt_version=PROMPT_VERSION):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT answer FROM answer_cache
+            WHERE doc_hash = %s AND question_key = %s AND model = %s AND prompt_version = %s
+              AND expires_at > CURRENT_TIMESTAMP
+            """,
+            (doc_hash, question_key(question), model, prompt_version),
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def store_answer(doc_hash, question, model, answer, prompt_version=PROMPT_VERSION):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO answer_cache (doc_hash, question_key, model, prompt_version, question, answer, expires_at)
+            VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 hour')
+            ON CONFLICT (doc_hash, question_key, model, prompt_version)
+            DO UPDATE SET answer = EXCLUDED.answer, question = EXCLUDED.question,
+                          created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+            """,
+            (doc_hash, question_key(question), model, prompt_version, question, answer, _ttl_hours()),
+        )
+
+
+# 🔹 Drop every cached answer for these documents (a replaced version, a deleted account's library)
+def invalidate_document(*doc_hashes):
+    if not doc_hashes:
+        return
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM answer_cache WHERE doc_hash = ANY(%s)", (list(doc_hashes),))
+
+
+def purge_expired_answers():
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM answer_cache WHERE expires_at <= CURRENT_TIMESTAMP")
+
+
+# 🔹 Answer `questions` on a background thread and cache them, once per document per process
+def precompute_answers(doc_hash, questions, answer_fn, model):
+    with _precompute_lock:
+        if doc_hash in _precomputing:
+            return None
+        _precomputing.add(doc_hash)
+
+    def run():
+        try:
+            for question in questions:
+                if get_cached_answer(doc_hash, question, model) is None:
+                    store_answer(doc_hash, question, model, answer_fn(question))
+            purge_expired_answers()
+        except Exception as error:
+            # Best effort: the page still answers on demand if this fails
+            logger.warning("Answer precompute failed for %s: %s", doc_hash[:12], error)
+        finally:
+            with _precompute_lock:
+                _precomputing.discard(doc_hash)
+
+    thread = threading.Thread(target=run, daemon=True, name=f"precompute-{doc_hash[:12]}")
+    thread.start()
+    return thread
@@ -0,0 +1,194 @@
+import json
+import os
+import re
+from collections import Counter
+import numpy as np
+
+
+# ======================= BM25 Keyword Index =======================
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over chunks with flat numpy postings.
+
+    Postings for term t are doc_ids[term_offsets[t]:term_offsets[t + 1]] (and matching tfs),
+    so a lookup is a couple of array slices instead of walking Python objects. doc_ids are
+    ordinals; labels[ordinal] is the chunk's label in the vector index (its position by default).
+    """
+
+    def __init__(self, vocab, term_offsets, doc_ids, tfs, doc_lengths, labels=None, k1=1.5, b=0.75):
+        self.vocab = vocab
+        self.labels = np.arange(len(doc_lengths), dtype=np.int64) if labels is None else labels
+        self.term_offsets = term_offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        doc_freq = np.diff(term_offsets).astype(np.float32)
+        self.idf = np.log1p((len(doc_lengths) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts, labels=None):
+        postings = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[position] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((position, tf))
+
+        vocab = {term: term_id for term_id, term in enumerate(postings)}
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for term_id, term in enumerate(postings):
+            term_offsets[term_id + 1] = term_offsets[term_id] + len(postings[term])
+        doc_ids = np.empty(term_offsets[-1], dtype=np.int32)
+        tfs = np.empty(term_offsets[-1], dtype=np.uint16)
+        for term_id, term in enumerate(postings):
+            entries = np.asarray(postings[term], dtype=np.int64)
+            doc_ids[term_offsets[term_id]:term_offsets[term_id + 1]] = entries[:, 0]
+            tfs[term_offsets[term_id]:term_offsets[term_id + 1]] = np.minimum(entries[:, 1], 65535)
+        labels = None if labels is None else np.asarray(labels, dtype=np.int64)
+        return cls(vocab, term_offsets, doc_ids, tfs, doc_lengths, labels)
+
+    def search(self, query, k=20):
+        """Returns [(label, score)] best first."""
+        ids_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, stop = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            ids = self.doc_ids[start:stop]
+            tf = self.tfs[start:stop].astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[ids] / self.avg_length)
+            ids_parts.append(ids)
+            score_parts.append(self.idf[term_id] * tf * (self.k1 + 1) / (tf + norm))
+        if not ids_parts:
+            return []
+
+        ids = np.concatenate(ids_parts)
+        scores = np.bincount(ids, weights=np.concatenate(score_parts))
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(scores[matched], -k)[-k:]]
+        matched = matched[np.argsort(scores[matched])[::-1]]
+        return list(zip(self.labels[matched].tolist(), scores[matched].tolist()))
+
+    def save(self, folder):
+        np.savez(os.path.join(folder, "bm25.npz"), term_offsets=self.term_offsets, doc_ids=self.doc_ids,
+                 tfs=self.tfs, doc_lengths=self.doc_lengths, labels=self.labels)
+        with open(os.path.join(folder, "bm25_vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(list(self.vocab), f)
+
+    @classmethod
+    def load(cls, folder):
+        if not os.path.exists(os.path.join(folder, "bm25.npz")):
+            return None
+        arrays = np.load(os.path.join(folder, "bm25.npz"))
+        with open(os.path.join(folder, "bm25_vocab.json"), encoding="utf-8") as f:
+            vocab = {term: term_id for term_id, term in enumerate(json.load(f))}
+        labels = arrays["labels"] if "labels" in arrays.files else None
+        return cls(vocab, arrays["term_offsets"], arrays["doc_ids"], arrays["tfs"], arrays["doc_lengths"], labels)
+
+
+class SegmentedBM25:
+    """A BM25Index plus the chunks added and the labels deleted since it was built, so edits to a
+    shard don't rebuild the keyword index over every chunk. Added chunks get their own small index;
+    search() merges both and drops deleted labels. Changes replace the collections instead of
+    mutating them, so a concurrent search sees either the old or the new state.
+    """
+
+    def __init__(self, main=None, added=None, deleted=None):
+        self.main = main
+        self.added = added or {}  # label -> text
+        self.deleted = frozenset(deleted or ())
+        self._segment = None
+
+    @property
+    def pending(self):
+        """Changes since `main` was built; past a share of the shard it's time for a full rebuild."""
+        return len(self.added) + len(self.deleted)
+
+    def add(self, labels, texts):
+        self.added = {**self.added, **dict(zip(labels, texts))}
+        self._segment = None
+
+    def delete(self, labels):
+        added = dict(self.added)
+        deleted = set(self.deleted)
+        for label in labels:
+            if added.pop(label, None) is None:
+                deleted.add(label)
+        self.added, self.deleted, self._segment = added, frozenset(deleted), None
+
+    def search(self, query, k=20):
+        """Returns [(label, score)] best first."""
+        added, deleted, segment = self.added, self.deleted, self._segment
+        if segment is None and added:
+            segment = self._segment = BM25Index.build(list(added.values()), list(added))
+        results = []
+        if self.main is not None:
+            results += [(label, score) for label, score in self.main.search(query, k + len(deleted)) if label not in deleted]
+        if segment is not None:
+            results += segment.search(query, k)
+        return sorted(results, key=lambda item: item[1], reverse=True)[:k]
+
+
+def store_labels(vector_store):
+    """Index labels of a LangChain FAISS store in ascending order (positions 0..n-1 unless ids are mapped)."""
+    return sorted(vector_store.index_to_docstore_id)
+
+
+def store_texts(vector_store):
+    """Chunk texts of a LangChain FAISS store in label order."""
+    return [vector_store.docstore.search(vector_store.index_to_docstore_id[label]).page_content
+            for label in store_labels(vector_store)]
+
+
+# ======================= Hybrid Retrieval =======================
+
+def _dense_positions(vector_store, question, k, search_params=None, query_vector=None):
+    if query_vector is None:
+        query_vector = vector_store._embed_query(question)
+    vector = np.array(query_vector, dtype=np.float32).reshape(1, -1)
+    if vector_store._normalize_L2:
+        import faiss
+        faiss.normalize_L2(vector)
+    _, positions = vector_store.index.search(vector, k, params=search_params)
+    return [position for position in positions[0].tolist() if position != -1]
+
+
+# 🔹 Dense + BM25 lists fused with reciprocal rank fusion: score = Σ 1 / (rrf_k + rank)
+def hybrid_search(vector_store, bm25, question, k=3, fetch_k=20, rrf_k=60, doc_filter=None, with_positions=False,
+                  search_params=None, query_vector=None):
+    """Top-k Documents, or (Document, position, fused score) tuples when `with_positions` is set.
+    `search_params` (faiss.SearchParameters) go to the dense search, e.g. to skip deleted labels;
+    `query_vector` is the question's embedding if the caller already has it."""
+    ranked_lists = [_dense_positions(vector_store, question, fetch_k, search_params, query_vector)]
+    if bm25 is not None:
+        ranked_lists.append([position for position, _ in bm25.search(question, fetch_k)])
+
+    fused = {}
+    for ranked in ranked_lists:
+        for rank, position in enumerate(ranked):
+            fused[position] = fused.get(position, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+    results = []
+    for position, score in sorted(fused.items(), key=lambda item: item[1], reverse=True):
+        doc_id = vector_store.index_to_docstore_id.get(position)
+        if doc_id is None:
+            continue
+        doc = vector_store.docstore.search(doc_id)
+        if doc_filter is None or doc_filter(doc):
+            results.append((doc, position, score) if with_positions else doc)
+            if len(results) == k:
+                break
+    return results
@@ -0,0 +1,187 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from utils.config import get_setting
+from utils.extraction import LocalFile, extraction_key, iter_chunks, iter_document_text
+from utils.index_cache import document_key
+from utils.resources import get_embeddings
+from utils.workspace import get_workspace, list_documents, record_documents
+
+
+# ======================= Bulk Ingestion CLI =======================
+#
+# Loads a folder of documents into one user's library without the web app:
+#
+#   python -m utils.bulk_ingest ./customer-docs --user-id 42 --workers 8
+#
+# Worker processes read, extract and split files (the same extractors and splitter as uploads);
+# the main process embeds each batch through the cached, rate-limited embeddings client, adds it
+# to the user's shard and records it in Postgres with one statement. The shard (and its lock, see
+# Workspace) is written out every --save-every batches and at the end rather than per batch, so a
+# run doesn't re-pickle the whole shard for every few documents. Documents that are already in the
+# shard are skipped, so an interrupted run is resumed by running it again; batches lost with an
+# unsaved shard come back from the embedding cache without new API calls.
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".csv", ".xlsx", ".txt")
+
+_splitter = None
+_done_keys = frozenset()
+
+
+def _init_worker(chunk_size, chunk_overlap, done_keys):
+    global _splitter, _done_keys
+    _splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    _done_keys = done_keys
+    # Files are already spread over processes, don't start a PDF page pool inside each one
+    os.environ["CHATDOCS_INGESTION_PDF_WORKERS"] = "1"
+
+
+def _process_file(path, chunk_size, chunk_overlap, embedding_model):
+    """Returns (path, doc_key, name, chunks), chunks is None for documents that are already loaded."""
+    uploaded_file = LocalFile(path)
+    doc_key = document_key(uploaded_file.getvalue(), chunk_size, chunk_overlap, embedding_model,
+                           extraction_key(uploaded_file))
+    if doc_key in _done_keys:
+        return path, doc_key, uploaded_file.name, None
+    pieces = iter_document_text(uploaded_file)
+    chunks = list(iter_chunks(pieces, _splitter)) if pieces is not None else []
+    return path, doc_key, uploaded_file.name, chunks
+
+
+def find_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for folder, _, names in os.walk(path):
+            for name in sorted(names):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    yield os.path.join(folder, name)
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.docs = 0
+        self.chunks = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def report(self, final=False):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        print(
+            f"{'Done' if final else 'Progress'}: {self.docs} docs, {self.chunks} chunks in {elapsed:.0f}s "
+            f"({self.docs / elapsed:.2f} docs/s, {self.chunks / elapsed:.1f} chunks/s), "
+            f"{self.skipped} skipped, {self.failed} failed",
+            file=sys.stderr,
+        )
+
+
+# 🔹 Embed a batch of extracted documents, add them to the shard (saved when `save`) + one Postgres insert
+def _flush(batch, workspace, embeddings, user_id, stats, save):
+    texts = [chunk for _, _, chunks in batch for chunk in chunks]
+    vectors = embeddings.embed_documents(texts)
+    entries, offset = [], 0
+    for doc_key, name, chunks in batch:
+        entries.append((doc_key, name, chunks, vectors[offset:offset + len(chunks)]))
+        offset += len(chunks)
+    added = set(workspace.add_documents(entries, save=save))
+    record_documents(user_id, [(doc_key, name, len(chunks)) for doc_key, name, chunks in batch if doc_key in added])
+    stats.docs += len(added)
+    stats.chunks += sum(len(chunks) for doc_key, _, chunks in batch if doc_key in added)
+
+
+def _record_missing_metadata(workspace, user_id):
+    # A run interrupted between the shard save and the Postgres insert leaves unlisted documents
+    listed = set(list_documents(user_id))
+    missing = {}
+    if workspace.store is not None:
+        for doc in workspace.store.docstore._dict.values():
+            doc_hash = doc.metadata.get("doc_hash")
+            if doc_hash not in listed:
+                name, count = missing.get(doc_hash, (doc.metadata.get("doc_name", doc_hash), 0))
+                missing[doc_hash] = (name, count + 1)
+    if missing:
+        record_documents(user_id, [(doc_hash, name, count) for doc_hash, (name, count) in missing.items()])
+    return len(missing)
+
+
+def bulk_ingest(paths, user_id, workers=None, batch_docs=50, chunk_size=1000, chunk_overlap=100,
+                embedding_model="models/embedding-001", report_every=30.0, save_every=10):
+    os.environ.setdefault("GOOGLE_API_KEY", get_setting("general", "GOOGLE_API_KEY", ""))
+    embeddings = get_embeddings(embedding_model)
+    workspace = get_workspace(user_id, embeddings)
+    repaired = _record_missing_metadata(workspace, user_id)
+    if repaired:
+        print(f"Recorded {repaired} documents left unlisted by an earlier run.", file=sys.stderr)
+
+    workers = workers or os.cpu_count() or 1
+    stats = Stats()
+    batch = []
+    batches = 0
+    last_report = time.perf_counter()
+    files = find_files(paths)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(chunk_size, chunk_overlap, frozenset(workspace.doc_hashes()))) as pool:
+            pending = {}
+            # Keep a bounded number of files in flight so memory doesn't grow with the folder size
+            while True:
+                for path in files:
+                    pending[pool.submit(_process_file, path, chunk_size, chunk_overlap, embedding_model)] = path
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = pending.pop(future)
+                    try:
+                        path, doc_key, name, chunks = future.result()
+                    except Exception as error:
+                        stats.failed += 1
+                        print(f"Failed: {path}: {error}", file=sys.stderr)
+                        continue
+                    if chunks is None:
+                        stats.skipped += 1
+                    elif not chunks:
+                        stats.failed += 1
+                        print(f"No text extracted: {path}", file=sys.stderr)
+                    else:
+                        batch.append((doc_key, name, chunks))
+
+                if len(batch) >= batch_docs:
+                    batches += 1
+                    _flush(batch, workspace, embeddings, user_id, stats, save=batches % save_every == 0)
+                    batch = []
+                if time.perf_counter() - last_report >= report_every:
+                    stats.report()
+                    last_report = time.perf_counter()
+
+        if batch:
+            _flush(batch, workspace, embeddings, user_id, stats, save=True)
+    finally:
+        # Also on Ctrl+C/errors: keep what was added and release the shard for the web app
+        workspace.save()
+    stats.report(final=True)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load documents into a ChatDocs user's library.")
+    parser.add_argument("paths", nargs="+", help="Files or folders (searched recursively)")
+    parser.add_argument("--user-id", type=int, required=True, help="Library owner")
+    parser.add_argument("--workers", type=int, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--batch-docs", type=int, default=50, help="Documents per embed/insert batch")
+    parser.add_argument("--save-every", type=int, default=10, help="Batches between shard saves")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--embedding-model", default="models/embedding-001")
+    args = parser.parse_args()
+
+    bulk_ingest(args.paths, args.user_id, args.workers, args.batch_docs,
+                args.chunk_size, args.chunk_overlap, args.embedding_model, save_every=args.save_every)
@@ -0,0 +1,15 @@
+import os
+import streamlit as st
+
+
+# ======================= Settings =======================
+
+# 🔹 Read a setting from Streamlit secrets, falling back to an environment variable and then a default
+def get_setting(section, key, default=None):
+    env_value = os.environ.get(f"CHATDOCS_{section.upper()}_{key.upper()}")
+    if env_value is not None:
+        return env_value
+    try:
+        return st.secrets[section][key]
+    except (KeyError, FileNotFoundError):
+        return default
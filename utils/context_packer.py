@@ -0,0 +1,70 @@
+# ======================= Token-Budgeted Context Packing =======================
+#
+# Retrieved chunks overlap (chunk_overlap) and neighbours often come back together, so sending
+# them as-is repeats text. The packer merges adjacent chunks of the same document into spans,
+# drops repeated text, ranks spans by retrieval score and fills a token budget.
+
+CHARS_PER_TOKEN = 4  # Rough average for English text; avoids a tokenizer API call per question
+MAX_OVERLAP_CHARS = 400
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _overlap(left, right):
+    # Longest suffix of `left` that is a prefix of `right`
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_spans(hits):
+    """hits: [(doc_key, source, position, text, score)] -> spans with neighbours merged.
+
+    Neighbours are matched on doc_key (the document hash); `source` is only the display name,
+    which two different library documents can share.
+    """
+    spans = []
+    previous = None
+    for doc_key, source, position, text, score in sorted(hits, key=lambda hit: (hit[0], hit[2])):
+        if previous and previous[0] == doc_key and position == previous[1] + 1:
+            span = spans[-1]
+            span["text"] += text[_overlap(span["text"], text):]
+            span["score"] = max(span["score"], score)
+        elif previous and previous[0] == doc_key and position == previous[1]:
+            continue  # Same chunk retrieved twice
+        else:
+            spans.append({"source": source, "text": text, "score": score})
+        previous = (doc_key, position)
+
+    # Identical text under different positions (repeated boilerplate) is sent once
+    seen = set()
+    unique = []
+    for span in spans:
+        key = span["text"].strip()
+        if key not in seen:
+            seen.add(key)
+            unique.append(span)
+    return unique
+
+
+# 🔹 Returns ([(source, text)], tokens_used) for the best spans that fit in `token_budget`
+def pack_context(hits, token_budget, min_tail_tokens=50):
+    packed = []
+    used = 0
+    for span in sorted(_merge_spans(hits), key=lambda span: span["score"], reverse=True):
+        tokens = estimate_tokens(span["text"])
+        if used + tokens <= token_budget:
+            packed.append((span["source"], span["text"]))
+            used += tokens
+            continue
+        remaining = token_budget - used
+        if remaining >= min_tail_tokens:
+            # Trim the last span at a word boundary to use the rest of the budget
+            text = span["text"][:remaining * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+            packed.append((span["source"], text))
+            used += estimate_tokens(text)
+        break
+    return packed, used
@@ -0,0 +1,104 @@
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+import streamlit as st
+from utils.config import get_setting
+
+
+# ======================= Connection Pool =======================
+
+class DatabasePool:
+    """Process-wide psycopg2 pool that health-checks connections before handing them out."""
+
+    def __init__(self, min_size, max_size, healthcheck_interval, **connect_kwargs):
+        self._pool = ThreadedConnectionPool(min_size, max_size, **connect_kwargs)
+        # Block instead of raising PoolError when every connection is busy
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}
+        self.max_size = max_size
+        self.healthcheck_interval = healthcheck_interval
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        # Skip the round trip for connections that were used recently
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        self._slots.acquire()
+        try:
+            conn = self._pool.getconn()
+            # Stale (e.g. Neon closed idle connections while suspended): every idle connection may be,
+            # so keep replacing; once they are all closed the pool opens a fresh one
+            for _ in range(self.max_size):
+                if self._is_healthy(conn):
+                    break
+                self._close(conn)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _close(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def putconn(self, conn, close=False):
+        try:
+            if close or conn.closed:
+                self._close(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+@st.cache_resource
+def get_pool():
+    return DatabasePool(
+        min_size=int(get_setting("database", "POOL_MIN_SIZE", 1)),
+        max_size=int(get_setting("database", "POOL_MAX_SIZE", 10)),
+        healthcheck_interval=float(get_setting("database", "HEALTHCHECK_INTERVAL", 30)),
+        dbname=get_setting("database", "DB_NAME"),
+        user=get_setting("database", "DB_USER"),
+        password=get_setting("database", "DB_PASSWORD"),
+        host=get_setting("database", "DB_HOST"),
+        port=get_setting("database", "DB_PORT"),
+        connect_timeout=10,
+        keepalives=1,
+        keepalives_idle=30,
+    )
+
+
+# 🔹 Borrow a pooled connection: commits on success, rolls back on error, always returns it
+@contextmanager
+def get_connection():
+    db_pool = get_pool()
+    conn = db_pool.getconn()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn, close=broken)
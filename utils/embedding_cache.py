@@ -0,0 +1,112 @@
+import hashlib
+import os
+import re
+import threading
+import numpy as np
+import streamlit as st
+from langchain_core.embeddings import Embeddings
+from utils.config import get_setting
+
+
+# ======================= Chunk Keys =======================
+
+# 🔹 Same chunk text + same model -> same vector, no matter which document it came from
+def chunk_key(text, model_name):
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+
+# ======================= On-Disk Vector Store =======================
+
+class EmbeddingCache:
+    """Append-only file of (sha256 key, float32 vector) records, one file per model."""
+
+    def __init__(self, root, model_name):
+        self.folder = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        os.makedirs(self.folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._dim = None
+        for name in os.listdir(self.folder):
+            match = re.fullmatch(r"vectors-d(\d+)\.bin", name)
+            if match:
+                self._dim = int(match.group(1))
+        self._refresh()
+
+    def _record_dtype(self):
+        return np.dtype([("key", "S32"), ("vector", "<f4", (self._dim,))])
+
+    def _path(self):
+        return os.path.join(self.folder, f"vectors-d{self._dim}.bin")
+
+    def _refresh(self):
+        # Pick up records appended since the last read (also by other processes)
+        if self._dim is None or not os.path.exists(self._path()):
+            return
+        dtype = self._record_dtype()
+        count = os.path.getsize(self._path()) // dtype.itemsize
+        if count == len(self._vectors):
+            return
+        records = np.memmap(self._path(), dtype=dtype, mode="r", shape=(count,))
+        for row in range(len(self._vectors), count):
+            self._rows[bytes(records["key"][row])] = row
+        self._vectors = records["vector"]
+
+    def get_many(self, keys):
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+            return {key: self._vectors[self._rows[key]] for key in keys if key in self._rows}
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            records = np.empty(len(keys), dtype=self._record_dtype())
+            records["key"] = keys
+            records["vector"] = vectors
+            # One append per batch keeps keys and vectors aligned on disk
+            with open(self._path(), "ab") as f:
+                f.write(records.tobytes())
+            self._refresh()
+
+    def __len__(self):
+        return len(self._rows)
+
+
+# ======================= Embeddings Wrapper =======================
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embeddings client so only chunks missing from the cache hit the API."""
+
+    def __init__(self, embeddings, cache, model_name):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts):
+        keys = [chunk_key(text, self.model_name) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # Embed each missing chunk once, even if it repeats inside the document
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing.keys()), new_vectors)
+            found.update(zip(missing.keys(), np.asarray(new_vectors, dtype=np.float32)))
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+# 🔹 One cache per model per process, shared by all sessions
+@st.cache_resource
+def get_embedding_cache(model_name):
+    root = get_setting("cache", "EMBEDDING_DIR", os.path.join(".cache", "embeddings"))
+    return EmbeddingCache(root, model_name)
@@ -0,0 +1,161 @@
+import argparse
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import streamlit as st
+from langchain_core.embeddings import Embeddings
+from utils.config import get_setting
+
+
+# ======================= Rate Limiting =======================
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_rate_limit_error(error):
+    # google.api_core ResourceExhausted, HTTP clients with a status code, or a plain message
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "ResourceExhausted" in type(error).__name__
+
+
+# ======================= Batched Concurrent Executor =======================
+
+class EmbeddingExecutor(Embeddings):
+    """Runs an embeddings client with batching, bounded concurrency, rate limiting and 429 backoff."""
+
+    def __init__(self, embeddings, batch_size=100, max_batch_chars=60_000, max_in_flight=4,
+                 requests_per_minute=600, max_retries=6, base_delay=1.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.bucket = TokenBucket(requests_per_minute / 60.0)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed")
+
+    def _batches(self, texts):
+        # Fill each request up to the item limit or the character budget, whichever comes first
+        batch, chars = [], 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                yield batch
+                batch, chars = [], 0
+            batch.append(text)
+            chars += len(text)
+        if batch:
+            yield batch
+
+    def _call(self, fn, arg):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                return fn(arg)
+            except Exception as error:
+                if attempt == self.max_retries or not is_rate_limit_error(error):
+                    raise
+                # Exponential backoff with jitter so concurrent requests don't retry in lockstep
+                time.sleep(self.base_delay * (2 ** attempt) * (0.5 + random.random()))
+
+    def embed_documents(self, texts):
+        batches = list(self._batches(texts))
+        if len(batches) == 1:
+            return self._call(self.embeddings.embed_documents, batches[0])
+        vectors = []
+        for batch_vectors in self._pool.map(lambda batch: self._call(self.embeddings.embed_documents, batch), batches):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def embed_query(self, text):
+        return self._call(self.embeddings.embed_query, text)
+
+
+# ======================= Offline Fake Backend =======================
+
+class FakeEmbeddingBackend(Embeddings):
+    """Deterministic hash-based vectors with simulated latency and 429s, for benchmarks and tests."""
+
+    def __init__(self, size=768, latency=0.05, per_text_latency=0.0005, rate_limit_probability=0.0):
+        self.size = size
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.rate_limit_probability = rate_limit_probability
+        self.calls = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        if random.random() < self.rate_limit_probability:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED (simulated)")
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# 🔹 One executor per model per process so every session shares the same rate limit
+@st.cache_resource
+def get_embedding_executor(model_name):
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return EmbeddingExecutor(
+        GoogleGenerativeAIEmbeddings(model=model_name),
+        batch_size=int(get_setting("embeddings", "BATCH_SIZE", 100)),
+        max_in_flight=int(get_setting("embeddings", "MAX_IN_FLIGHT", 4)),
+        requests_per_minute=float(get_setting("embeddings", "REQUESTS_PER_MINUTE", 600)),
+    )
+
+
+# ======================= Benchmark =======================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the embedding executor against the fake backend.")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per request")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.02)
+    args = parser.parse_args()
+
+    texts = [f"chunk {i} " * 50 for i in range(args.chunks)]
+
+    backend = FakeEmbeddingBackend(latency=args.latency)
+    start = time.perf_counter()
+    for text in texts[:200]:
+        backend.embed_documents([text])
+    serial_rate = 200 / (time.perf_counter() - start)
+    print(f"serial, one chunk per call : {serial_rate:8.0f} chunks/s")
+
+    for max_in_flight in (1, 4, 8):
+        backend = FakeEmbeddingBackend(latency=args.latency, rate_limit_probability=args.rate_limit_probability)
+        executor = EmbeddingExecutor(backend, max_in_flight=max_in_flight, requests_per_minute=60_000, base_delay=0.05)
+        start = time.perf_counter()
+        executor.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+        print(f"batched, {max_in_flight} in flight       : {args.chunks / elapsed:8.0f} chunks/s ({backend.calls} calls)")
@@ -0,0 +1,262 @@
+import mimetypes
+import os
+import tempfile
+import threading
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO, StringIO
+from multiprocessing import get_all_start_methods, get_context
+import pandas as pd
+from openpyxl import load_workbook
+from docx import Document
+from PyPDF2 import PdfReader
+from utils.config import get_setting
+
+
+# ======================= PDF Extraction =======================
+
+# Below this many pages a process pool costs more than it saves
+PARALLEL_PDF_MIN_PAGES = 40
+PAGES_PER_TASK = 8
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+_worker_reader = (None, None)  # (path, PdfReader) of the PDF this worker process read last
+
+
+def _pdf_workers():
+    return int(get_setting("ingestion", "PDF_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+# 🔹 One small page-extraction pool per process, shared by every upload. Workers are started by a
+#    forkserver (spawn on Windows) rather than forked from a thread of the multithreaded server
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            method = "forkserver" if "forkserver" in get_all_start_methods() else "spawn"
+            _pdf_pool = ProcessPoolExecutor(max_workers=_pdf_workers(), mp_context=get_context(method))
+        return _pdf_pool
+
+
+def _reset_pdf_pool(pool):
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_page_range(pdf_path, start, stop):
+    # Each worker parses a PDF once and then serves its page ranges from it
+    global _worker_reader
+    if _worker_reader[0] != pdf_path:
+        _worker_reader = (pdf_path, PdfReader(pdf_path))
+    return [_worker_reader[1].pages[number].extract_text() or "" for number in range(start, stop)]
+
+
+# 🔹 Yield the text of each PDF page in order, extracting every page exactly once
+def iter_pdf_pages(uploaded_file, workers=None):
+    pdf_bytes = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+    reader = PdfReader(BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+    workers = int(workers or _pdf_workers())
+
+    if workers <= 1 or page_count < PARALLEL_PDF_MIN_PAGES:
+        for page in reader.pages:
+            text = page.extract_text()
+            if text:
+                yield text
+        return
+
+    # Workers read the PDF from a temp file instead of each receiving a copy of the bytes
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(pdf_bytes)
+    pool = _get_pdf_pool()
+    futures = []
+    try:
+        futures = [pool.submit(_extract_page_range, f.name, start, min(start + PAGES_PER_TASK, page_count))
+                   for start in range(0, page_count, PAGES_PER_TASK)]
+        # Results in page order as soon as each range is done
+        for future in futures:
+            for text in future.result():
+                if text:
+                    yield text
+    except BrokenProcessPool:
+        _reset_pdf_pool(pool)  # A worker died; the next upload gets a new pool
+        raise
+    finally:
+        # Closing the generator early (ingestion stopped) drops the ranges nobody will read
+        for future in futures:
+            future.cancel()
+        try:
+            os.remove(f.name)
+        except OSError:
+            pass  # Still open in a worker (Windows); it's a temp file
+
+
+def extract_text_from_pdf(uploaded_file):
+    return "\n".join(iter_pdf_pages(uploaded_file))
+
+
+# ======================= Other Formats =======================
+
+def extract_text_from_docx(uploaded_file):
+    doc = Document(uploaded_file)
+    return "\n".join([para.text for para in doc.paragraphs])
+
+def extract_text_from_csv(uploaded_file):
+    return "\n\n".join(iter_csv_row_groups(uploaded_file))
+
+def extract_text_from_xlsx(uploaded_file):
+    return "\n\n".join(iter_xlsx_row_groups(uploaded_file))
+
+def extract_text_from_txt(uploaded_file):
+    return StringIO(uploaded_file.getvalue().decode("utf-8")).read()
+
+
+# ======================= Tabular Extraction =======================
+#
+# Rows are streamed (pandas chunks for CSV, openpyxl read-only for XLSX) and packed into compact
+# row groups that each start with the header, so every chunk can be read on its own and no row is
+# split across chunks. Cells are joined with " | " instead of df.to_string()'s column padding.
+
+CSV_READ_ROWS = 5000
+
+
+class RowGroup(str):
+    """A chunk that is already sized and self-contained; iter_chunks() passes it through unsplit."""
+
+
+# Bump when the tabular extractor's output changes so indexes cached from the old chunks stop matching
+TABLE_EXTRACTOR_VERSION = "row-groups-v1"
+
+
+def _table_chunk_chars():
+    return int(get_setting("ingestion", "TABLE_CHUNK_CHARS", 1000))
+
+
+# 🔹 Extractor version + settings that shape this file's chunks, part of its index cache key
+#    (empty for formats whose chunks only depend on the splitter, so their keys stay the same)
+def extraction_key(uploaded_file):
+    if uploaded_file.name.lower().endswith((".csv", ".xlsx")):
+        return f"{TABLE_EXTRACTOR_VERSION}|{_table_chunk_chars()}"
+    return ""
+
+
+def _format_row(values):
+    return " | ".join("" if value is None else str(value).strip() for value in values)
+
+
+def _row_groups(title, header, lines, max_chars):
+    heading = f"{title}\n{_format_row(header)}"
+    group, size = [], len(heading)
+    for line in lines:
+        if not line.replace("|", "").strip():
+            continue
+        if group and size + len(line) + 1 > max_chars:
+            yield RowGroup("\n".join([heading, *group]))
+            group, size = [], len(heading)
+        group.append(line)
+        size += len(line) + 1
+    if group:
+        yield RowGroup("\n".join([heading, *group]))
+
+
+def _frame_lines(frame):
+    # Column-wise string concatenation is much faster than formatting row by row
+    columns = [frame[column].str.strip() for column in frame.columns]
+    lines = columns[0]
+    for column in columns[1:]:
+        lines = lines + " | " + column
+    return lines.tolist()
+
+
+# 🔹 Header-prefixed row groups of a CSV, read CSV_READ_ROWS rows at a time
+def iter_csv_row_groups(uploaded_file, max_chars=None):
+    reader = pd.read_csv(uploaded_file, chunksize=CSV_READ_ROWS, dtype=str, keep_default_na=False)
+    first = next(reader, None)
+    if first is None:
+        return
+    lines = (line for frame in chain([first], reader) for line in _frame_lines(frame))
+    yield from _row_groups(f"File: {uploaded_file.name}", list(first.columns), lines, max_chars or _table_chunk_chars())
+
+
+# 🔹 Header-prefixed row groups of every sheet of a workbook, streamed in read-only mode
+def iter_xlsx_row_groups(uploaded_file, max_chars=None):
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            # The first non-empty row is the header
+            header = next((row for row in rows if any(value is not None for value in row)), None)
+            if header is None:
+                continue
+            lines = (_format_row(row) for row in rows)
+            yield from _row_groups(f"Sheet: {sheet.title}", header, lines, max_chars or _table_chunk_chars())
+    finally:
+        workbook.close()
+
+
+# ======================= Local Files =======================
+
+class LocalFile(BytesIO):
+    """A file on disk with the attributes the extractors read from Streamlit's UploadedFile."""
+
+    def __init__(self, path, name=None, file_type=None):
+        with open(path, "rb") as f:
+            super().__init__(f.read())
+        self.name = name or os.path.basename(path)
+        self.type = file_type or mimetypes.guess_type(self.name)[0] or "application/octet-stream"
+        self.size = len(self.getvalue())
+
+
+# ======================= Streaming Dispatch =======================
+
+# 🔹 Text pieces for any supported upload (one per PDF page), or None if the type is unsupported
+def iter_document_text(uploaded_file):
+    file_type = uploaded_file.type
+    if "pdf" in file_type:
+        return iter_pdf_pages(uploaded_file)
+    elif "word" in file_type or "docx" in uploaded_file.name:
+        return iter([extract_text_from_docx(uploaded_file)])
+    elif "csv" in file_type:
+        return iter_csv_row_groups(uploaded_file)
+    elif "excel" in file_type or "spreadsheet" in file_type or "xlsx" in uploaded_file.name:
+        return iter_xlsx_row_groups(uploaded_file)
+    elif "text" in file_type or "txt" in uploaded_file.name:
+        return iter([extract_text_from_txt(uploaded_file)])
+    return None
+
+
+# 🔹 Split text pieces into chunks as they arrive instead of joining the whole document first
+def iter_chunks(pieces, text_splitter, buffer_chars=8000):
+    buffer = ""
+    for piece in pieces:
+        if isinstance(piece, RowGroup):
+            # Row groups are already chunk-sized, flush any prose before passing them through
+            if buffer:
+                yield from text_splitter.split_text(buffer)
+                buffer = ""
+            yield str(piece)
+            continue
+        buffer = f"{buffer}\n{piece}" if buffer else piece
+        if len(buffer) < buffer_chars:
+            continue
+        chunks = text_splitter.split_text(buffer)
+        # The last chunk may continue on the next page, so it is re-split with it
+        yield from chunks[:-1]
+        buffer = chunks[-1] if chunks else ""
+    if buffer:
+        yield from text_splitter.split_text(buffer)
+
+
+# 🔹 How many pieces iter_document_text() can yield at most (used for progress bars)
+def count_document_pieces(uploaded_file):
+    if "pdf" in uploaded_file.type:
+        return len(PdfReader(BytesIO(uploaded_file.getvalue())).pages)
+    if "csv" in uploaded_file.type:
+        # Estimate: row groups are about TABLE_CHUNK_CHARS of the raw file each
+        return max(1, uploaded_file.size // _table_chunk_chars())
+    return 1
@@ -0,0 +1,80 @@
+from utils.db import get_connection
+
+
+# ======================= Chat History Queries =======================
+
+PAGE_SIZE = 20
+
+# One round trip: the user's document list plus one keyset page of chats for the
+# selected document (falls back to the most recently used document).
+# The document list is a loose index scan over chat_history_user_pdf_ts_idx: one index probe per
+# distinct pdf_name (plus one for its latest chat) instead of grouping every row the user has.
+HISTORY_QUERY = """
+WITH RECURSIVE names AS (
+    (SELECT pdf_name FROM chat_history
+     WHERE user_id = %(user_id)s
+     ORDER BY pdf_name LIMIT 1)
+    UNION ALL
+    SELECT (SELECT c.pdf_name FROM chat_history c
+            WHERE c.user_id = %(user_id)s AND c.pdf_name > n.pdf_name
+            ORDER BY c.pdf_name LIMIT 1)
+    FROM names n
+    WHERE n.pdf_name IS NOT NULL
+), docs AS (
+    SELECT n.pdf_name, latest.timestamp AS last_used
+    FROM names n
+    CROSS JOIN LATERAL (
+        SELECT c.timestamp FROM chat_history c
+        WHERE c.user_id = %(user_id)s AND c.pdf_name = n.pdf_name
+        ORDER BY c.timestamp DESC LIMIT 1
+    ) latest
+    WHERE n.pdf_name IS NOT NULL
+), selected AS (
+    SELECT COALESCE(
+        (SELECT pdf_name FROM docs WHERE pdf_name = %(pdf_name)s),
+        (SELECT pdf_name FROM docs ORDER BY last_used DESC, pdf_name LIMIT 1)
+    ) AS pdf_name
+)
+(SELECT 'doc' AS kind, pdf_name, NULL AS question, NULL AS answer, last_used AS timestamp, NULL AS id
+ FROM docs
+ ORDER BY last_used DESC, pdf_name)
+UNION ALL
+(SELECT 'chat', c.pdf_name, c.question, c.answer, c.timestamp, c.id
+ FROM chat_history c JOIN selected s ON c.pdf_name = s.pdf_name
+ WHERE c.user_id = %(user_id)s
+   AND (%(before_ts)s IS NULL OR (c.timestamp, c.id) < (%(before_ts)s, %(before_id)s))
+ ORDER BY c.timestamp DESC, c.id DESC
+ LIMIT %(limit)s)
+"""
+
+
+# 🔹 Fetch the document list and a page of chats older than `cursor` (a (timestamp, id) pair)
+def fetch_history(user_id, pdf_name=None, cursor=None, limit=PAGE_SIZE):
+    before_ts, before_id = cursor if cursor else (None, None)
+    with get_connection() as conn, conn.cursor() as db_cursor:
+        db_cursor.execute(HISTORY_QUERY, {
+            "user_id": user_id,
+            "pdf_name": pdf_name,
+            "before_ts": before_ts,
+            "before_id": before_id,
+            "limit": limit + 1,  # One extra row tells us whether another page exists
+        })
+        rows = db_cursor.fetchall()
+
+    documents = [row[1] for row in rows if row[0] == "doc"]
+    chats = [(row[2], row[3], row[4], row[5]) for row in rows if row[0] == "chat"]
+    next_cursor = None
+    if len(chats) > limit:
+        chats = chats[:limit]
+        next_cursor = (chats[-1][2], chats[-1][3])
+
+    # Mirrors the `selected` CTE so the caller knows which document the chats belong to
+    if pdf_name not in documents:
+        pdf_name = documents[0] if documents else None
+
+    return {
+        "documents": documents,
+        "pdf_name": pdf_name,
+        "chats": chats,
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,194 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError
+import streamlit as st
+from utils.config import get_setting
+from utils.db import get_connection
+
+
+# ======================= Write-Behind Chat History =======================
+
+INSERT_SQL = "INSERT INTO chat_history (user_id, pdf_name, question, answer, timestamp) VALUES %s"
+
+# Worth spooling and retrying later; anything else is a bad row
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError)
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriter:
+    """Background thread that batches chat_history inserts so answers never wait on Postgres.
+
+    Rows that can't be written (DB unreachable, queue full) go to an fsync'd JSON-lines spool
+    file and are replayed after the next successful flush.
+    """
+
+    def __init__(self, spool_path, batch_size=200, flush_interval=1.0, max_queue=10_000):
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        os.makedirs(os.path.dirname(spool_path) or ".", exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="history-writer")
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, user_id, pdf_name, question, answer):
+        # Timestamp now, not when the batch lands, so history order stays correct
+        row = (user_id, pdf_name, question, answer, datetime.now(timezone.utc))
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._spool([row])
+
+    # ---------- spool file ----------
+
+    def _spool(self, rows):
+        with self._spool_lock, open(self.spool_path, "a", encoding="utf-8") as f:
+            for user_id, pdf_name, question, answer, timestamp in rows:
+                f.write(json.dumps({
+                    "user_id": user_id, "pdf_name": pdf_name, "question": question,
+                    "answer": answer, "timestamp": timestamp.isoformat(),
+                }) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _row_from_line(line):
+        record = json.loads(line)
+        return (record["user_id"], record["pdf_name"], record["question"],
+                record["answer"], datetime.fromisoformat(record["timestamp"]))
+
+    def _replay_spool(self):
+        """Returns False if the connection failed again (the rest stays in the replay file)."""
+        replay_path = self.spool_path + ".replay"
+        offset_path = replay_path + ".offset"
+        with self._spool_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spool_path):
+                    return True
+                os.replace(self.spool_path, replay_path)
+
+        # The offset file holds the byte position after the last committed batch, so a failure or
+        # restart part-way through resumes there instead of inserting earlier batches again
+        offset = 0
+        if os.path.exists(offset_path):
+            with open(offset_path, encoding="utf-8") as f:
+                offset = int(f.read().strip() or 0)
+
+        with open(replay_path, "rb") as f:
+            f.seek(offset)
+            while True:
+                rows = []
+                while len(rows) < self.batch_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        rows.append(self._row_from_line(line.decode("utf-8")))
+                if not rows:
+                    break
+                if self._write(rows):
+                    return False
+                self._save_offset(offset_path, f.tell())
+
+        os.remove(replay_path)
+        if os.path.exists(offset_path):
+            os.remove(offset_path)
+        return True
+
+    @staticmethod
+    def _save_offset(offset_path, offset):
+        tmp_path = offset_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, offset_path)
+
+    # ---------- writer thread ----------
+
+    def _insert(self, rows):
+        with get_connection() as conn, conn.cursor() as cursor:
+            execute_values(cursor, INSERT_SQL, rows, page_size=self.batch_size)
+
+    def _write(self, rows):
+        """Returns the rows left unwritten because the connection failed ([] when all were handled)."""
+        try:
+            self._insert(rows)
+            return []
+        except CONNECTION_ERRORS:
+            return rows
+        except psycopg2.Error:
+            # e.g. the user was deleted meanwhile: keep the good rows, drop the bad ones
+            for number, row in enumerate(rows):
+                try:
+                    self._insert([row])
+                except CONNECTION_ERRORS:
+                    return rows[number:]
+                except psycopg2.Error as error:
+                    logger.warning("Dropping chat_history row for user %s: %s", row[0], error)
+            return []
+
+    def _flush(self, rows):
+        unwritten = self._write(rows)
+        if unwritten:
+            self._spool(unwritten)
+            return
+        # Anything left after a failed replay stays in the replay file for the next successful flush
+        self._replay_spool()
+
+    def _next_batch(self):
+        rows = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                rows.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while not self._stop.is_set():
+            rows = self._next_batch()
+            if rows:
+                try:
+                    self._flush(rows)
+                except Exception:
+                    logger.exception("History writer failed to flush %d rows", len(rows))
+        # Drain whatever is left on shutdown
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows:
+            self._flush(rows)
+
+    def close(self, timeout=10):
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+
+
+# 🔹 One writer thread per process
+@st.cache_resource
+def get_history_writer():
+    return HistoryWriter(
+        spool_path=get_setting("history", "SPOOL_PATH", os.path.join(".cache", "chat_history.spool")),
+        batch_size=int(get_setting("history", "BATCH_SIZE", 200)),
+        flush_interval=float(get_setting("history", "FLUSH_INTERVAL", 1.0)),
+    )
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+from langchain_community.vectorstores import FAISS    # type: ignore
+from utils.bm25 import BM25Index, store_texts
+from utils.config import get_setting
+from utils.mmap_store import is_mmap_store, load_mmap_store, save_mmap_store
+
+
+# ======================= Cache Keys =======================
+
+# 🔹 Content-addressed key: same bytes + same splitter/extractor/model settings -> same index
+def document_key(file_bytes, chunk_size, chunk_overlap, embedding_model, extraction=""):
+    """`extraction` is utils.extraction.extraction_key() of the file."""
+    digest = hashlib.sha256()
+    digest.update(file_bytes)
+    digest.update(f"|{chunk_size}|{chunk_overlap}|{embedding_model}".encode("utf-8"))
+    if extraction:
+        digest.update(f"|{extraction}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+# ======================= On-Disk Index Store =======================
+
+class IndexCache:
+    """FAISS indexes (and their chunk texts) saved under `root/<key>/`, evicted LRU by total size.
+
+    Indexes are stored in the memory-mapped layout from utils/mmap_store.py and opened stores are
+    shared by every session in the process.
+    """
+
+    def __init__(self, root, max_bytes, max_open=32):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._bm25 = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def load(self, key, embeddings):
+        folder = self._path(key)
+        with self._lock:
+            if key in self._open and os.path.exists(folder):
+                self._open.move_to_end(key)
+                os.utime(folder)
+                return self._open[key]
+        if not os.path.exists(os.path.join(folder, "index.faiss")):
+            return None
+        try:
+            if is_mmap_store(folder):
+                vector_store = load_mmap_store(folder, embeddings)
+            else:
+                vector_store = FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True)
+        except Exception:
+            # Half-written or incompatible entry, drop it and rebuild
+            shutil.rmtree(folder, ignore_errors=True)
+            return None
+        os.utime(folder)  # Mark as recently used for LRU eviction
+        with self._lock:
+            self._open[key] = vector_store
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return vector_store
+
+    def save(self, key, vector_store):
+        folder = self._path(key)
+        tmp_folder = f"{folder}.tmp-{os.getpid()}-{time.time_ns()}"
+        save_mmap_store(tmp_folder, vector_store)
+        BM25Index.build(store_texts(vector_store)).save(tmp_folder)  # Keyword side of hybrid retrieval
+        try:
+            os.rename(tmp_folder, folder)  # Atomic publish, readers never see a partial index
+        except OSError:
+            # Another session saved the same document first
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+        self.evict()
+
+    # 🔹 BM25 index saved next to the vectors (built on the fly for entries from older versions)
+    def load_bm25(self, key, vector_store):
+        with self._lock:
+            if key in self._bm25:
+                self._bm25.move_to_end(key)
+                return self._bm25[key]
+        folder = self._path(key)
+        bm25 = BM25Index.load(folder) if os.path.exists(folder) else None
+        if bm25 is None:
+            bm25 = BM25Index.build(store_texts(vector_store))
+            if os.path.exists(folder):
+                bm25.save(folder)
+        with self._lock:
+            self._bm25[key] = bm25
+            while len(self._bm25) > self.max_open:
+                self._bm25.popitem(last=False)
+        return bm25
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            folder = os.path.join(self.root, name)
+            if ".tmp-" in name or not os.path.isdir(folder):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+            entries.append((os.path.getmtime(folder), size, folder))
+            total += size
+
+        # Oldest first, always keep the most recently used entry
+        entries.sort()
+        for _, size, folder in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(folder, ignore_errors=True)
+            total -= size
+
+
+# 🔹 One cache object per process, shared by all sessions
+@st.cache_resource
+def get_index_cache():
+    root = get_setting("cache", "INDEX_DIR", os.path.join(".cache", "faiss"))
+    max_mb = int(get_setting("cache", "INDEX_MAX_MB", 2048))
+    return IndexCache(root, max_mb * 1024 * 1024)
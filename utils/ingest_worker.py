@@ -0,0 +1,89 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+from utils.config import get_setting
+from utils.extraction import LocalFile, count_document_pieces, iter_document_text
+from utils.index_cache import get_index_cache
+from utils.ingestion import build_index_pipelined
+from utils.jobs import claim_job, fail_job, finish_job, requeue_stale_jobs, update_progress
+from utils.resources import get_embeddings, get_text_splitter
+
+
+# ======================= Background Ingestion Worker =======================
+#
+# Runs outside Streamlit: claims queued uploads, extracts → splits → embeds → indexes them and
+# publishes the index to the shared index cache, where the web app picks it up (see utils/jobs.py).
+#
+#   python -m utils.ingest_worker --processes 2
+
+PROGRESS_INTERVAL = 1.0  # Seconds between progress/heartbeat writes
+
+
+def run_job(job):
+    uploaded_file = LocalFile(job["file_path"], job["file_name"], job["file_type"])
+    pieces = iter_document_text(uploaded_file)
+    if pieces is None:
+        raise ValueError(f"unsupported file type {job['file_type']!r}")
+
+    embeddings = get_embeddings(job["embedding_model"])
+    text_splitter = get_text_splitter(job["chunk_size"], job["chunk_overlap"])
+    total_pieces = count_document_pieces(uploaded_file)
+    last_update = [0.0]
+
+    def on_progress(pieces_done, chunks_indexed):
+        if time.monotonic() - last_update[0] >= PROGRESS_INTERVAL:
+            update_progress(job["id"], min(pieces_done / total_pieces, 0.99))
+            last_update[0] = time.monotonic()
+
+    vector_store = build_index_pipelined(pieces, text_splitter, embeddings, on_progress=on_progress)
+    if vector_store is None:
+        raise ValueError("no text could be extracted from this document")
+    get_index_cache().save(job["doc_key"], vector_store)
+    return vector_store.index.ntotal
+
+
+def work(poll_seconds=2.0, once=False):
+    os.environ.setdefault("GOOGLE_API_KEY", get_setting("general", "GOOGLE_API_KEY", ""))
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"Ingestion worker {worker} started.")
+    while True:
+        requeue_stale_jobs()
+        job = claim_job(worker)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_seconds)
+            continue
+
+        started = time.perf_counter()
+        try:
+            chunk_count = run_job(job)
+        except Exception as error:
+            print(f"Job {job['id']} ({job['file_name']}) failed: {error}")
+            fail_job(job["id"], error)
+        else:
+            finish_job(job["id"], chunk_count)
+            print(f"Job {job['id']} ({job['file_name']}): {chunk_count} chunks in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued ChatDocs uploads in the background.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to run")
+    parser.add_argument("--poll", type=float, default=2.0, help="Seconds to wait when the queue is empty")
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        work(args.poll, args.once)
+    else:
+        processes = [multiprocessing.Process(target=work, args=(args.poll, args.once)) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,116 @@
+import queue
+import threading
+from langchain_community.vectorstores import FAISS    # type: ignore
+from utils.extraction import iter_chunks
+
+
+# ======================= Pipelined Ingestion =======================
+#
+# extract/split thread --chunk batches--> embed thread --vector batches--> caller (FAISS adds)
+#
+# Queues are bounded so a fast stage can only run a few batches ahead of a slow one,
+# and total time is bounded by the slowest stage instead of the sum of all of them.
+
+_DONE = object()
+
+
+class _StageFailed:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(out_queue, item, stop):
+    """Returns False if the pipeline was stopped (e.g. a Streamlit rerun interrupted the script)."""
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(in_queue, stop):
+    while not stop.is_set():
+        try:
+            item = in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _StageFailed):
+            raise item.error
+        yield item
+
+
+def _start_stage(work, out_queue, stop):
+    def run():
+        try:
+            work()
+        except BaseException as error:
+            _put(out_queue, _StageFailed(error), stop)
+        finally:
+            _put(out_queue, _DONE, stop)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+# 🔹 Build a FAISS index while the document is still being extracted
+def build_index_pipelined(pieces, text_splitter, embeddings, batch_size=400, queue_size=4, on_progress=None):
+    """Returns the FAISS store, or None if the document produced no chunks.
+
+    `on_progress(pieces_done, chunks_indexed)` is called from the calling thread after every batch.
+    The default batch size lets the embedding executor keep several API requests in flight.
+    """
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    vector_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    pieces_done = [0]
+
+    def counted(pieces):
+        for piece in pieces:
+            pieces_done[0] += 1
+            yield piece
+
+    def split_stage():
+        try:
+            batch = []
+            for chunk in iter_chunks(counted(pieces), text_splitter):
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    if not _put(chunk_queue, batch, stop):
+                        return
+                    batch = []
+            if batch:
+                _put(chunk_queue, batch, stop)
+        finally:
+            # Stops the extractor (and its page pool) instead of reading the rest of the document
+            if hasattr(pieces, "close"):
+                pieces.close()
+
+    def embed_stage():
+        for batch in _drain(chunk_queue, stop):
+            if not _put(vector_queue, (batch, embeddings.embed_documents(batch)), stop):
+                return
+
+    threads = [_start_stage(split_stage, chunk_queue, stop), _start_stage(embed_stage, vector_queue, stop)]
+
+    vector_store = None
+    chunks_indexed = 0
+    try:
+        for texts, vectors in _drain(vector_queue, stop):
+            pairs = list(zip(texts, vectors))
+            if vector_store is None:
+                vector_store = FAISS.from_embeddings(pairs, embeddings)
+            else:
+                vector_store.add_embeddings(pairs)
+            chunks_indexed += len(pairs)
+            if on_progress:
+                on_progress(pieces_done[0], chunks_indexed)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=1)
+    return vector_store
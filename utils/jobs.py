@@ -0,0 +1,194 @@
+import os
+from utils.config import get_setting
+from utils.db import get_connection
+
+
+# ======================= Ingestion Job Queue (Postgres) =======================
+#
+# Uploads that miss the index cache are spooled to JOB_DIR and queued in `ingestion_jobs`.
+# Worker processes (python -m utils.ingest_worker) claim jobs with FOR UPDATE SKIP LOCKED, so any
+# number of them can run next to the web app without two workers taking the same job.
+
+JOB_STATES = ("queued", "running", "done", "failed")
+JOB_COLUMNS = ("id", "user_id", "doc_key", "file_name", "file_type", "file_path", "chunk_size", "chunk_overlap",
+               "embedding_model", "status", "progress", "chunk_count", "error", "attempts", "worker",
+               "created_at", "started_at", "finished_at")
+
+
+def _job_dir():
+    return get_setting("ingestion", "JOB_DIR", os.path.join(".cache", "jobs"))
+
+
+def _max_attempts():
+    return int(get_setting("ingestion", "JOB_MAX_ATTEMPTS", 3))
+
+
+def background_ingestion_enabled():
+    return str(get_setting("ingestion", "BACKGROUND_WORKER", "false")).lower() in ("1", "true", "yes")
+
+
+def _row_to_job(row):
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+
+# 🔹 Queue an upload (once per document while it is pending), returns the job
+def enqueue_job(user_id, uploaded_file, doc_key, chunk_size, chunk_overlap, embedding_model):
+    os.makedirs(_job_dir(), exist_ok=True)
+    file_path = os.path.join(_job_dir(), doc_key + os.path.splitext(uploaded_file.name)[1].lower())
+    if not os.path.exists(file_path):
+        tmp_path = f"{file_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(uploaded_file.getvalue())
+        os.replace(tmp_path, file_path)
+
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO ingestion_jobs (user_id, doc_key, file_name, file_type, file_path,
+                                        chunk_size, chunk_overlap, embedding_model)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (doc_key) WHERE status IN ('queued', 'running') DO NOTHING
+            """,
+            (user_id, doc_key, uploaded_file.name, uploaded_file.type, file_path,
+             chunk_size, chunk_overlap, embedding_model),
+        )
+    return get_job(doc_key)
+
+
+def get_job(doc_key):
+    """Latest job for a document, or None."""
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM ingestion_jobs WHERE doc_key = %s ORDER BY id DESC LIMIT 1",
+            (doc_key,),
+        )
+        return _row_to_job(cursor.fetchone())
+
+
+def list_jobs(limit=50, user_id=None, status=None):
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("user_id = %s")
+        params.append(user_id)
+    if status is not None:
+        conditions.append("status = %s")
+        params.append(status)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM ingestion_jobs {where} ORDER BY id DESC LIMIT %s",
+            (*params, limit),
+        )
+        return [_row_to_job(row) for row in cursor.fetchall()]
+
+
+def job_counts():
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT status, COUNT(*) FROM ingestion_jobs GROUP BY status")
+        counts = dict(cursor.fetchall())
+    return {state: counts.get(state, 0) for state in JOB_STATES}
+
+
+def requeue_job(job_id):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE ingestion_jobs SET status = 'queued', error = NULL, progress = 0, attempts = 0
+            WHERE id = %s AND status = 'failed'
+              AND NOT EXISTS (SELECT 1 FROM ingestion_jobs active
+                              WHERE active.doc_key = ingestion_jobs.doc_key AND active.status IN ('queued', 'running'))
+            """,
+            (job_id,),
+        )
+
+
+def requeue_failed_jobs():
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE ingestion_jobs SET status = 'queued', error = NULL, progress = 0, attempts = 0
+            WHERE id IN (SELECT DISTINCT ON (doc_key) id FROM ingestion_jobs WHERE status = 'failed'
+                         ORDER BY doc_key, id DESC)
+              AND NOT EXISTS (SELECT 1 FROM ingestion_jobs active
+                              WHERE active.doc_key = ingestion_jobs.doc_key AND active.status IN ('queued', 'running'))
+            """
+        )
+        return cursor.rowcount
+
+
+# ======================= Worker Side =======================
+
+# 🔹 Take the oldest queued job; concurrent workers skip rows another worker has locked
+def claim_job(worker):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE ingestion_jobs
+            SET status = 'running', worker = %s, attempts = attempts + 1, progress = 0,
+                started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM ingestion_jobs WHERE status = 'queued'
+                ORDER BY created_at, id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING {', '.join(JOB_COLUMNS)}
+            """,
+            (worker,),
+        )
+        return _row_to_job(cursor.fetchone())
+
+
+def update_progress(job_id, progress):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "UPDATE ingestion_jobs SET progress = %s, heartbeat_at = CURRENT_TIMESTAMP WHERE id = %s",
+            (progress, job_id),
+        )
+
+
+def finish_job(job_id, chunk_count):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE ingestion_jobs SET status = 'done', progress = 1, chunk_count = %s,
+                                      finished_at = CURRENT_TIMESTAMP, error = NULL
+            WHERE id = %s RETURNING file_path
+            """,
+            (chunk_count, job_id),
+        )
+        row = cursor.fetchone()
+    if row:
+        try:
+            os.remove(row[0])
+        except OSError:
+            pass
+
+
+# 🔹 Requeue until JOB_MAX_ATTEMPTS, then mark the job failed
+def fail_job(job_id, error):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE ingestion_jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                error = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+            """,
+            (_max_attempts(), str(error)[:2000], job_id),
+        )
+
+
+# 🔹 Jobs whose worker stopped sending heartbeats (crashed / killed) go back to the queue
+def requeue_stale_jobs(stale_minutes=10):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE ingestion_jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                error = 'worker stopped responding'
+            WHERE status = 'running' AND heartbeat_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 minute'
+            """,
+            (_max_attempts(), stale_minutes),
+        )
+        return cursor.rowcount
@@ -0,0 +1,208 @@
+import argparse
+import streamlit as st
+from utils.config import get_setting
+from utils.db import get_connection
+
+
+# ======================= Schema Migrations =======================
+
+# Each migration is (version, description, statements, transactional).
+# Statements must be idempotent so an existing Neon database can be adopted as-is.
+# Non-transactional migrations run in autocommit mode (needed for CREATE INDEX CONCURRENTLY).
+MIGRATIONS = [
+    (1, "create users and chat_history tables", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            pdf_name TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ], True),
+    (2, "index chat_history and users hot lookups", [
+        # Sidebar: WHERE user_id AND pdf_name ORDER BY timestamp DESC, id DESC (keyset pages)
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_history_user_pdf_ts_idx
+        ON chat_history (user_id, pdf_name, timestamp DESC, id DESC)
+        """,
+        # Per-user scans ordered by time (history export, delete all)
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_history_user_ts_idx
+        ON chat_history (user_id, timestamp DESC)
+        """,
+        # Login and password reset
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_username_idx ON users (username)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_idx ON users (email)",
+    ], False),
+    (3, "create answer_cache table", [
+        """
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            doc_hash TEXT NOT NULL,
+            question_key CHAR(32) NOT NULL,
+            model TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (doc_hash, question_key, model, prompt_version)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS answer_cache_expires_idx ON answer_cache (expires_at)",
+    ], True),
+    (4, "create documents library table", [
+        """
+        CREATE TABLE IF NOT EXISTS documents (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            doc_hash TEXT NOT NULL,
+            name TEXT NOT NULL,
+            chunk_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, doc_hash)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS documents_user_created_idx ON documents (user_id, created_at DESC)",
+    ], True),
+    (5, "create summary_cache table", [
+        """
+        CREATE TABLE IF NOT EXISTS summary_cache (
+            node_key CHAR(64) NOT NULL,
+            model TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (node_key, model, prompt_version)
+        )
+        """,
+    ], True),
+    (6, "create ingestion_jobs queue table", [
+        """
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            doc_key TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            chunk_overlap INTEGER NOT NULL,
+            embedding_model TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            chunk_count INTEGER,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            heartbeat_at TIMESTAMP
+        )
+        """,
+        # One pending job per document; also the ON CONFLICT target of enqueue_job()
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ingestion_jobs_pending_doc_idx
+        ON ingestion_jobs (doc_key) WHERE status IN ('queued', 'running')
+        """,
+        # claim_job(): oldest queued first
+        "CREATE INDEX IF NOT EXISTS ingestion_jobs_status_created_idx ON ingestion_jobs (status, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ingestion_jobs_user_idx ON ingestion_jobs (user_id, id DESC)",
+    ], True),
+    (7, "add document versions", [
+        "ALTER TABLE documents ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE documents ADD COLUMN IF NOT EXISTS replaces TEXT",
+        "ALTER TABLE documents ADD COLUMN IF NOT EXISTS superseded_by TEXT",
+    ], True),
+]
+
+# Arbitrary constant so concurrent app processes don't migrate at the same time
+MIGRATION_LOCK_ID = 7_203_114
+
+
+def _applied_versions(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+# 🔹 Apply every pending migration, returns the versions that were applied
+def migrate():
+    applied_now = []
+    with get_connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+                try:
+                    applied = _applied_versions(cursor)
+                    for version, description, statements, transactional in MIGRATIONS:
+                        if version in applied:
+                            continue
+                        if transactional:
+                            cursor.execute("BEGIN")
+                        for statement in statements:
+                            cursor.execute(statement)
+                        cursor.execute(
+                            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                            (version, description),
+                        )
+                        if transactional:
+                            cursor.execute("COMMIT")
+                        applied_now.append(version)
+                except Exception:
+                    if not conn.closed:
+                        cursor.execute("ROLLBACK")
+                    raise
+                finally:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        finally:
+            conn.autocommit = False
+    return applied_now
+
+
+def migration_status():
+    with get_connection() as conn, conn.cursor() as cursor:
+        applied = _applied_versions(cursor)
+    return [(version, description, version in applied) for version, description, _, _ in MIGRATIONS]
+
+
+# 🔹 Run once per process when the app starts (disable with AUTO_MIGRATE = false)
+@st.cache_resource(show_spinner=False)
+def ensure_schema():
+    if str(get_setting("database", "AUTO_MIGRATE", "true")).lower() in ("false", "0", "no"):
+        return []
+    return migrate()
+
+
+# ======================= CLI =======================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply ChatDocs database migrations.")
+    parser.add_argument("--status", action="store_true", help="List migrations and whether they are applied")
+    args = parser.parse_args()
+
+    if args.status:
+        for version, description, done in migration_status():
+            print(f"{'✅' if done else '⏳'} {version:>3}  {description}")
+    else:
+        versions = migrate()
+        print(f"Applied migrations: {versions}" if versions else "Database schema is up to date.")
@@ -0,0 +1,124 @@
+import json
+import os
+from collections.abc import Mapping
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore    # type: ignore
+from langchain_community.vectorstores import FAISS    # type: ignore
+from langchain_community.vectorstores.utils import DistanceStrategy    # type: ignore
+from langchain_core.documents import Document
+from utils.ann import index_type_of, restore_direct_map, set_search_params
+
+
+# ======================= Memory-Mapped Vector Store =======================
+#
+# Folder layout:
+#   index.faiss   FAISS index (opened with mmap flags, read-only)
+#   texts.bin     all chunk texts, utf-8, back to back
+#   offsets.npy   int64[n + 1], chunk i is texts.bin[offsets[i]:offsets[i + 1]]
+#   meta.json     index type, vector count, distance settings, optional per-chunk metadata
+#
+# Nothing is copied into the process heap on load, so every session (and process) using the
+# same document shares the OS page cache instead of holding its own copy.
+
+def _read_flags(index_type):
+    flags = faiss.IO_FLAG_READ_ONLY
+    if index_type.startswith("ivf"):
+        return flags | faiss.IO_FLAG_MMAP  # Inverted lists mapped from the file
+    # Flat/HNSW vector codes mapped directly (falls back to a plain read on older FAISS)
+    return flags | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+class MmapTexts:
+    def __init__(self, folder):
+        self.offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+        size = int(self.offsets[-1])
+        self.data = np.memmap(os.path.join(folder, "texts.bin"), dtype=np.uint8, mode="r", shape=(size,)) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[int(self.offsets[i]):int(self.offsets[i + 1])]).decode("utf-8")
+
+
+class MmapDocstore(Docstore):
+    """Read-only docstore whose ids are chunk positions ("0", "1", ...)."""
+
+    def __init__(self, texts, metadatas=None):
+        self.texts = texts
+        self.metadatas = metadatas
+
+    def search(self, search):
+        position = int(search)
+        if not 0 <= position < len(self.texts):
+            return f"ID {search} not found."
+        metadata = self.metadatas[position] if self.metadatas else {}
+        return Document(page_content=self.texts[position], metadata=metadata)
+
+    def add(self, texts):
+        raise NotImplementedError("Memory-mapped stores are read-only")
+
+    def delete(self, ids):
+        raise NotImplementedError("Memory-mapped stores are read-only")
+
+
+class PositionIds(Mapping):
+    """index_to_docstore_id without a per-chunk dict: position i -> "i"."""
+
+    def __init__(self, count):
+        self.count = count
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.count:
+            raise KeyError(position)
+        return str(position)
+
+    def __iter__(self):
+        return iter(range(self.count))
+
+    def __len__(self):
+        return self.count
+
+
+# 🔹 Write any LangChain FAISS store in the mmap layout
+def save_mmap_store(folder, vector_store):
+    os.makedirs(folder, exist_ok=True)
+    count = vector_store.index.ntotal
+    docs = [vector_store.docstore.search(vector_store.index_to_docstore_id[i]) for i in range(count)]
+
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    with open(os.path.join(folder, "texts.bin"), "wb") as f:
+        for i, doc in enumerate(docs):
+            encoded = doc.page_content.encode("utf-8")
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+    np.save(os.path.join(folder, "offsets.npy"), offsets)
+
+    faiss.write_index(vector_store.index, os.path.join(folder, "index.faiss"))
+    with open(os.path.join(folder, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "index_type": index_type_of(vector_store.index),
+            "count": count,
+            "normalize_L2": bool(vector_store._normalize_L2),
+            "distance_strategy": vector_store.distance_strategy.value,
+            "metadatas": [doc.metadata for doc in docs] if any(doc.metadata for doc in docs) else None,
+        }, f)
+
+
+def is_mmap_store(folder):
+    return os.path.exists(os.path.join(folder, "meta.json"))
+
+
+def load_mmap_store(folder, embeddings):
+    with open(os.path.join(folder, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    index = faiss.read_index(os.path.join(folder, "index.faiss"), _read_flags(meta["index_type"]))
+    return FAISS(
+        embeddings,
+        set_search_params(restore_direct_map(index)),
+        MmapDocstore(MmapTexts(folder), meta["metadatas"]),
+        PositionIds(meta["count"]),
+        normalize_L2=meta["normalize_L2"],
+        distance_strategy=DistanceStrategy(meta["distance_strategy"]),
+    )
@@ -0,0 +1,34 @@
+from langchain.prompts import PromptTemplate
+from utils.context_packer import estimate_tokens
+
+
+# ======================= Packed-Context QA =======================
+
+QA_PROMPT = PromptTemplate.from_template(
+    """Answer the question using only the numbered sources below. If the answer is not in the sources, say that you don't know.
+
+Sources ({source_count} sources, about {context_tokens} tokens):
+{sources}
+
+Question ({question_tokens} tokens): {question}
+
+Answer:"""
+)
+
+
+def build_prompt(packed, context_tokens, question):
+    sources = "\n\n".join(f"[{number}] ({source})\n{text}" for number, (source, text) in enumerate(packed, start=1))
+    return QA_PROMPT.format(
+        source_count=len(packed),
+        context_tokens=context_tokens,
+        sources=sources,
+        question_tokens=estimate_tokens(question),
+        question=question,
+    )
+
+
+# 🔹 Stream the answer token by token for a packed context (see utils/context_packer.py)
+def stream_packed_answer(llm, packed, context_tokens, question):
+    for chunk in llm.stream(build_prompt(packed, context_tokens, question)):
+        if chunk.content:
+            yield chunk.content
@@ -0,0 +1,24 @@
+import streamlit as st
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_google_genai import ChatGoogleGenerativeAI
+from utils.embedding_cache import CachedEmbeddings, get_embedding_cache
+from utils.embedding_executor import get_embedding_executor
+
+
+# ======================= Shared Resources =======================
+# Built once per process (per model/config) instead of on every question or rerun.
+
+@st.cache_resource
+def get_llm(model_name):
+    return ChatGoogleGenerativeAI(model=model_name)
+
+
+# 🔹 Chunk cache -> batched, rate-limited executor -> Gemini embeddings client
+@st.cache_resource
+def get_embeddings(model_name):
+    return CachedEmbeddings(get_embedding_executor(model_name), get_embedding_cache(model_name), model_name)
+
+
+@st.cache_resource
+def get_text_splitter(chunk_size, chunk_overlap):
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
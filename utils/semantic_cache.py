@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+import faiss
+import numpy as np
+import streamlit as st
+from utils.config import get_setting
+
+
+# ======================= Semantic Question Cache =======================
+
+class SemanticQuestionCache:
+    """Per-document FAISS index of past questions; near-duplicates reuse the stored answer."""
+
+    def __init__(self, threshold=0.92, max_documents=256, max_questions=500):
+        self.threshold = threshold
+        self.max_documents = max_documents
+        self.max_questions = max_questions
+        self._documents = OrderedDict()  # doc_hash -> (faiss index, [answers])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def embed(question, embeddings):
+        # A query embedding: not written to the chunk embedding cache, and the same vector can be
+        # passed on to the dense search (hybrid_search's query_vector) instead of embedding twice
+        return np.asarray([embeddings.embed_query(question)], dtype=np.float32)
+
+    @staticmethod
+    def _normalized(vector):
+        vector = np.array(vector, dtype=np.float32)  # Copy: the caller's vector also feeds the dense search
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, doc_hash, vector):
+        """Returns (answer, similarity) for the closest past question above the threshold, else None."""
+        vector = self._normalized(vector)
+        with self._lock:
+            entry = self._documents.get(doc_hash)
+            if entry is not None and entry[0].ntotal:
+                self._documents.move_to_end(doc_hash)
+                scores, ids = entry[0].search(vector, 1)
+                if scores[0][0] >= self.threshold:
+                    self.hits += 1
+                    return entry[1][ids[0][0]], float(scores[0][0])
+            self.misses += 1
+            return None
+
+    def add(self, doc_hash, vector, answer):
+        vector = self._normalized(vector)
+        with self._lock:
+            entry = self._documents.get(doc_hash)
+            if entry is None or entry[0].ntotal >= self.max_questions:
+                # Start over when a document's question list fills up
+                entry = (faiss.IndexFlatIP(vector.shape[1]), [])
+                self._documents[doc_hash] = entry
+            entry[0].add(vector)
+            entry[1].append(answer)
+            self._documents.move_to_end(doc_hash)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+    def metrics(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "documents": len(self._documents),
+            }
+
+
+# 🔹 Shared by every session in this process (metrics are per process)
+@st.cache_resource
+def get_semantic_cache():
+    return SemanticQuestionCache(threshold=float(get_setting("cache", "SEMANTIC_THRESHOLD", 0.92)))
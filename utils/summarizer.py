@@ -0,0 +1,198 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from langchain.prompts import PromptTemplate
+from utils.config import get_setting
+from utils.context_packer import estimate_tokens
+from utils.db import get_connection
+
+
+# ======================= Map-Reduce Summaries =======================
+#
+# Whole-document questions ("Summarize this document.") are answered from every chunk instead of
+# the top-k: chunks are grouped into leaves, each leaf is summarized (map, in parallel) and the
+# summaries are combined level by level (reduce) into one root. Every node is cached in Postgres
+# under a hash of its inputs, so re-asking is free and a document that gained pages only
+# re-summarizes the leaves that changed plus their ancestors.
+
+# Bump when the prompts below change so old partial summaries stop matching
+SUMMARY_PROMPT_VERSION = "mapreduce-v1"
+
+MAP_PROMPT = PromptTemplate.from_template(
+    """Summarize the following part of a document. Keep every key point, name, number and date.
+
+{text}
+
+Summary:"""
+)
+
+REDUCE_PROMPT = PromptTemplate.from_template(
+    """The following are summaries of consecutive parts of one document. Combine them into one summary
+that keeps the key points in document order.
+
+{text}
+
+Summary:"""
+)
+
+FINAL_PROMPT = PromptTemplate.from_template(
+    """Below is a summary of a whole document, built from all of its parts.
+
+{text}
+
+Using only this summary, answer: {question}
+
+Answer:"""
+)
+
+# Only phrasings that need the whole document; "main topic", "conclusions" etc. are answered
+# well enough from the retrieved chunks
+SUMMARY_QUESTION_WORDS = ("summarize", "summarise", "summary", "key points", "main points", "overview", "tl;dr")
+
+
+def is_summary_question(question):
+    question = question.lower()
+    return any(word in question for word in SUMMARY_QUESTION_WORDS)
+
+
+def _leaf_tokens():
+    return int(get_setting("summarize", "LEAF_TOKENS", 3000))
+
+
+def _fan_in():
+    return int(get_setting("summarize", "FAN_IN", 6))
+
+
+def _max_concurrency():
+    return int(get_setting("summarize", "MAX_CONCURRENCY", 4))
+
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# 🔹 Content-defined leaves: a leaf ends after a chunk whose hash hits the boundary condition (or at
+#    the size cap), so inserting pages only reshapes the leaves around the insertion point instead
+#    of shifting every later leaf like fixed-size groups would
+def group_chunks(texts, leaf_tokens):
+    average_tokens = max(1, sum(estimate_tokens(text) for text in texts) // max(1, len(texts)))
+    target_chunks = max(2, leaf_tokens // average_tokens)
+    leaves = []
+    current, current_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > 2 * leaf_tokens:
+            leaves.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+        if int(_hash(text)[:8], 16) % target_chunks == 0 and current_tokens >= leaf_tokens // 2:
+            leaves.append(current)
+            current, current_tokens = [], 0
+    if current:
+        leaves.append(current)
+    return leaves
+
+
+# 🔹 Same rule one level up: a group of child summaries ends after a child whose key hits the boundary
+#    condition (at least 2 per group, at most 2 * fan_in), so a changed leaf only changes the groups
+#    around it instead of shifting every later group at each level
+def group_keys(keys, fan_in):
+    groups, current = [], []
+    for position, key in enumerate(keys):
+        current.append(position)
+        if len(current) >= 2 * fan_in or (len(current) >= 2 and int(key[-8:], 16) % fan_in == 0):
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+    return groups
+
+
+# ======================= Node Cache (Postgres) =======================
+
+def _cached_summaries(keys, model):
+    if not keys:
+        return {}
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT node_key, summary FROM summary_cache
+            WHERE node_key = ANY(%s) AND model = %s AND prompt_version = %s
+            """,
+            (list(keys), model, SUMMARY_PROMPT_VERSION),
+        )
+        return dict(cursor.fetchall())
+
+
+def _store_summary(key, model, summary):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO summary_cache (node_key, model, prompt_version, summary) VALUES (%s, %s, %s, %s)
+            ON CONFLICT (node_key, model, prompt_version) DO UPDATE SET summary = EXCLUDED.summary
+            """,
+            (key, model, SUMMARY_PROMPT_VERSION, summary),
+        )
+
+
+# ======================= Map / Reduce =======================
+
+def _summarize_level(llm, model, prompt, nodes, on_progress=None):
+    """nodes: [(key, text)] -> [summary], cached nodes are not sent to the LLM."""
+    summaries = _cached_summaries({key for key, _ in nodes}, model)
+    missing = {key: text for key, text in nodes if key not in summaries}
+    done = len(nodes) - len(missing)
+    if on_progress:
+        on_progress(done, len(nodes))
+
+    def run(item):
+        key, text = item
+        summary = llm.invoke(prompt.format(text=text)).content
+        _store_summary(key, model, summary)
+        return key, summary
+
+    # Bounded concurrency keeps us inside the Gemini rate limit on 300-page documents
+    with ThreadPoolExecutor(max_workers=_max_concurrency()) as pool:
+        for key, summary in pool.map(run, missing.items()):
+            summaries[key] = summary
+            done += 1
+            if on_progress:
+                on_progress(done, len(nodes))
+    return [summaries[key] for key, _ in nodes]
+
+
+# 🔹 Map over the leaves, then reduce ~FAN_IN summaries at a time until one root summary is left
+def summarize_chunks(llm, model, texts, on_progress=None):
+    if not texts:
+        return ""
+    leaves = group_chunks(texts, _leaf_tokens())
+    keys = [_hash("leaf", *(_hash(text) for text in leaf)) for leaf in leaves]
+    summaries = _summarize_level(llm, model, MAP_PROMPT, [(key, "\n\n".join(leaf)) for key, leaf in zip(keys, leaves)],
+                                 on_progress)
+
+    fan_in = _fan_in()
+    while len(summaries) > 1:
+        nodes = []
+        for group in group_keys(keys, fan_in):
+            nodes.append((_hash("node", *(keys[i] for i in group)), "\n\n".join(summaries[i] for i in group)))
+        keys = [key for key, _ in nodes]
+        summaries = _summarize_level(llm, model, REDUCE_PROMPT, nodes, on_progress)
+    return summaries[0]
+
+
+# 🔹 Stream the answer to a whole-document question from the root summaries of `documents`
+def stream_summary_answer(llm, model, documents, question, on_progress=None):
+    """documents: [(name, chunk texts in document order)]"""
+    roots = [(name, summarize_chunks(llm, model, texts, on_progress)) for name, texts in documents]
+    if len(roots) == 1:
+        text = roots[0][1]
+    else:
+        text = "\n\n".join(f"[{number}] ({name})\n{summary}" for number, (name, summary) in enumerate(roots, start=1))
+    for chunk in llm.stream(FINAL_PROMPT.format(text=text, question=question)):
+        if chunk.content:
+            yield chunk.content
+
@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from io import BytesIO
+import pandas as pd
+import streamlit as st
+from langchain.prompts import PromptTemplate
+from utils.config import get_setting
+
+
+# ======================= Structured Queries over Spreadsheets =======================
+#
+# Aggregation questions about a CSV/XLSX upload ("total revenue in March") are answered from the
+# table itself instead of from embedded text: the LLM only translates the question into a small
+# JSON query plan, which is validated against the columns and run with vectorized pandas.
+# Tables are kept as Parquet under TABLE_DIR/<doc key>/ so later sessions skip CSV/XLSX parsing.
+
+FILTER_OPS = {"==", "!=", ">", ">=", "<", "<=", "contains", "in", "between"}
+DATE_PARTS = {"year", "month", "day", "weekday", "quarter", "date"}
+AGGREGATIONS = {"count", "sum", "mean", "median", "min", "max", "nunique"}
+MAX_RESULT_ROWS = 50
+
+# Only questions that read like aggregations (or name a column) are worth a planning call
+AGGREGATION_WORDS = re.compile(
+    r"\b(how (many|much)|count|number of|total|sum|average|avg|mean|median|min(imum)?|max(imum)?|highest|"
+    r"lowest|largest|smallest|most|least|top \d+|per|by (year|month|quarter|day)|distinct|unique|between)\b"
+)
+
+PLAN_PROMPT = PromptTemplate.from_template(
+    """You translate questions about spreadsheet tables into a JSON query plan.
+
+Tables:
+{schema}
+
+Plan format (JSON only, no prose):
+{{"table": "<table name>",
+  "filters": [{{"column": "<column>", "op": "==|!=|>|>=|<|<=|contains|in|between", "value": <value or list>,
+               "part": "year|month|day|weekday|quarter|date (optional, for date columns)"}}],
+  "group_by": ["<column>"],
+  "aggregations": [{{"column": "<column or *>", "func": "count|sum|mean|median|min|max|nunique"}}],
+  "sort": {{"by": "<column or func_column>", "descending": true}},
+  "limit": <number>}}
+Omit keys you don't need. Months are numbers (March = 3). If the question can't be answered with this
+format (e.g. it asks for a summary or an explanation), return {{"unsupported": true}}.
+
+Question: {question}
+Plan:"""
+)
+
+
+class QueryPlanError(ValueError):
+    pass
+
+
+def _table_root():
+    return get_setting("cache", "TABLE_DIR", os.path.join(".cache", "tables"))
+
+
+def is_tabular(uploaded_file):
+    return uploaded_file.name.lower().endswith((".csv", ".xlsx"))
+
+
+def _read_tables(uploaded_file):
+    data = BytesIO(uploaded_file.getvalue())
+    if uploaded_file.name.lower().endswith(".csv"):
+        return {os.path.splitext(uploaded_file.name)[0]: pd.read_csv(data)}
+    return pd.read_excel(data, sheet_name=None)
+
+
+def _is_text(series):
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+
+
+def _parse_dates(frame):
+    # Text columns that parse cleanly as dates become datetime so "in March" filters work
+    for column in frame.columns:
+        if _is_text(frame[column]):
+            parsed = pd.to_datetime(frame[column], errors="coerce", format="mixed")
+            if parsed.notna().sum() >= 0.9 * frame[column].notna().sum() > 0:
+                frame[column] = parsed
+    return frame
+
+
+# 🔹 {sheet name: DataFrame} for an upload, read from the Parquet cache after the first time
+@st.cache_resource(max_entries=16, show_spinner=False)
+def load_tables(doc_key, _uploaded_file):
+    folder = os.path.join(_table_root(), doc_key)
+    manifest = os.path.join(folder, "tables.json")
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            names = json.load(f)
+        return {name: pd.read_parquet(os.path.join(folder, f"{number}.parquet")) for number, name in enumerate(names)}
+
+    tables = {str(name): _parse_dates(frame.dropna(how="all")) for name, frame in _read_tables(_uploaded_file).items()}
+    tmp_folder = f"{folder}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp_folder, exist_ok=True)
+    for number, frame in enumerate(tables.values()):
+        # Parquet needs string column names; mixed object columns are stored as text
+        frame = frame.rename(columns=str)
+        for column in frame.columns:
+            if pd.api.types.is_object_dtype(frame[column]):
+                frame[column] = frame[column].astype("string")
+        frame.to_parquet(os.path.join(tmp_folder, f"{number}.parquet"), index=False)
+    with open(os.path.join(tmp_folder, "tables.json"), "w", encoding="utf-8") as f:
+        json.dump(list(tables), f)
+    if not os.path.exists(folder):
+        os.rename(tmp_folder, folder)
+    return {name: frame.rename(columns=str) for name, frame in tables.items()}
+
+
+def describe_tables(tables, sample_rows=3):
+    parts = []
+    for name, frame in tables.items():
+        columns = ", ".join(f"{column} ({frame[column].dtype})" for column in frame.columns)
+        sample = frame.head(sample_rows).to_dict(orient="records")
+        parts.append(f'Table "{name}" ({len(frame)} rows): {columns}\nSample rows: {json.dumps(sample, default=str)}')
+    return "\n\n".join(parts)
+
+
+# ======================= Query Plans =======================
+
+def parse_plan(text):
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise QueryPlanError("no JSON object in the model output")
+    try:
+        return json.loads(match.group(0))
+    except json.JSONDecodeError as error:
+        raise QueryPlanError(f"invalid plan JSON: {error}") from error
+
+
+def _column(frame, name):
+    if name not in frame.columns:
+        raise QueryPlanError(f"unknown column {name!r}")
+    return frame[name]
+
+
+def _filter_mask(frame, condition):
+    op = condition.get("op")
+    if op not in FILTER_OPS:
+        raise QueryPlanError(f"unsupported filter op {op!r}")
+    series = _column(frame, condition.get("column"))
+    value = condition.get("value")
+
+    part = condition.get("part")
+    if part:
+        if part not in DATE_PARTS:
+            raise QueryPlanError(f"unsupported date part {part!r}")
+        if not pd.api.types.is_datetime64_any_dtype(series):
+            raise QueryPlanError(f"column {condition['column']!r} is not a date")
+        series = series.dt.date.astype(str) if part == "date" else getattr(series.dt, part)
+    elif pd.api.types.is_datetime64_any_dtype(series) and value is not None:
+        value = pd.to_datetime(value) if not isinstance(value, list) else [pd.to_datetime(item) for item in value]
+
+    if op == "contains":
+        return series.astype(str).str.contains(str(value), case=False, regex=False, na=False)
+    if op == "in":
+        return series.isin(value if isinstance(value, list) else [value])
+    if op == "between":
+        if not isinstance(value, list) or len(value) != 2:
+            raise QueryPlanError("between needs [low, high]")
+        return series.between(value[0], value[1])
+    if series.dtype.kind in "iuf" and isinstance(value, str):
+        value = pd.to_numeric(value)
+    if _is_text(series):
+        # Text equality is case-insensitive ("Failed" == "failed")
+        series, value = series.str.lower(), str(value).lower()
+    return {
+        "==": series == value, "!=": series != value,
+        ">": series > value, ">=": series >= value, "<": series < value, "<=": series <= value,
+    }[op]
+
+
+# 🔹 Run a validated plan with vectorized pandas; returns a scalar, Series or DataFrame
+def run_plan(tables, plan):
+    if plan.get("unsupported"):
+        raise QueryPlanError("question is not a table query")
+    name = plan.get("table", next(iter(tables)))
+    if name not in tables:
+        raise QueryPlanError(f"unknown table {name!r}")
+    frame = tables[name]
+
+    for condition in plan.get("filters") or []:
+        frame = frame[_filter_mask(frame, condition)]
+
+    group_by = plan.get("group_by") or []
+    for column in group_by:
+        _column(frame, column)
+    aggregations = plan.get("aggregations") or []
+
+    if aggregations:
+        values = {}
+        for aggregation in aggregations:
+            func, column = aggregation.get("func"), aggregation.get("column", "*")
+            if func not in AGGREGATIONS:
+                raise QueryPlanError(f"unsupported aggregation {func!r}")
+            label = "count" if column == "*" else f"{func}_{column}"
+            if column == "*":
+                values[label] = frame.groupby(group_by).size() if group_by else len(frame)
+            else:
+                _column(frame, column)
+                target = frame.groupby(group_by)[column] if group_by else frame[column]
+                values[label] = getattr(target, func)()
+        if not group_by:
+            return values[next(iter(values))] if len(values) == 1 else pd.Series(values)
+        result = pd.DataFrame(values).reset_index()
+    else:
+        result = frame[group_by] if group_by else frame
+
+    sort = plan.get("sort")
+    if sort:
+        by = sort.get("by")
+        if by not in result.columns:
+            raise QueryPlanError(f"unknown sort column {by!r}")
+        result = result.sort_values(by, ascending=not sort.get("descending", False))
+    limit = int(plan.get("limit") or MAX_RESULT_ROWS)
+    return result.head(min(limit, MAX_RESULT_ROWS))
+
+
+def format_result(result, plan):
+    if isinstance(result, pd.DataFrame):
+        body = "No matching rows." if result.empty else f"```\n{result.to_string(index=False)}\n```"
+    elif isinstance(result, pd.Series):
+        body = f"```\n{result.to_string()}\n```"
+    else:
+        body = f"**{result:,.2f}**" if isinstance(result, float) else f"**{result}**"
+    return f"{body}\n\n_Computed from table `{plan.get('table', '')}` with query plan:_ `{json.dumps(plan)}`"
+
+
+# Plans are reused for the same question on the same table (the model call is the slow part),
+# least recently used ones are dropped past PLAN_CACHE_SIZE
+PLAN_CACHE_SIZE = 512
+_plan_cache = OrderedDict()
+_plan_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def looks_like_table_query(tables, question):
+    question = question.lower()
+    if AGGREGATION_WORDS.search(question):
+        return True
+    return any(len(str(column)) >= 3 and str(column).lower() in question
+               for frame in tables.values() for column in frame.columns)
+
+
+# 🔹 Answer from the tables directly, or None when the question isn't a structured query.
+#    Other questions return None right away, without the planning round trip before the answer streams
+def answer_table_question(llm, doc_key, tables, question):
+    if not looks_like_table_query(tables, question):
+        return None
+    cache_key = (doc_key, question.strip().lower())
+    with _plan_lock:
+        plan = _plan_cache.get(cache_key)
+        if plan is not None:
+            _plan_cache.move_to_end(cache_key)
+    try:
+        if plan is None:
+            response = llm.invoke(PLAN_PROMPT.format(schema=describe_tables(tables), question=question))
+            plan = parse_plan(response.content)
+            with _plan_lock:
+                _plan_cache[cache_key] = plan
+                while len(_plan_cache) > PLAN_CACHE_SIZE:
+                    _plan_cache.popitem(last=False)
+        return format_result(run_plan(tables, plan), plan)
+    except (QueryPlanError, KeyError, TypeError, ValueError) as error:
+        # The normal path for questions that aren't table queries, not worth more than a debug line
+        logger.debug("Table query fallback for %s: %s", doc_key[:12], error)
+        return None
@@ -0,0 +1,89 @@
+import argparse
+import gzip
+import sys
+from utils.db import get_connection
+
+
+# ======================= COPY Export / Import =======================
+
+# Column lists are fixed so files stay importable after schema additions
+TABLES = {
+    "users": {"columns": ["id", "username", "email", "password"], "user_column": "id"},
+    "chat_history": {"columns": ["id", "user_id", "pdf_name", "question", "answer", "timestamp"], "user_column": "user_id"},
+}
+
+
+def _table(table):
+    if table not in TABLES:
+        raise ValueError(f"Unknown table '{table}', expected one of: {', '.join(TABLES)}")
+    return TABLES[table]
+
+
+# 🔹 Stream a table (optionally one user's rows) as CSV straight from Postgres into `out_file`
+def export_table(table, out_file, user_id=None, compress=True):
+    spec = _table(table)
+    columns = ", ".join(spec["columns"])
+    target = gzip.GzipFile(fileobj=out_file, mode="wb") if compress else out_file
+    try:
+        with get_connection() as conn, conn.cursor() as cursor:
+            query = f"SELECT {columns} FROM {table}"
+            if user_id is not None:
+                query = cursor.mogrify(f"{query} WHERE {spec['user_column']} = %s", (user_id,)).decode("utf-8")
+            cursor.copy_expert(f"COPY ({query} ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER true)", target)
+    finally:
+        if compress:
+            target.close()  # Writes the gzip trailer, leaves out_file open
+
+
+# 🔹 Load a CSV export via COPY into a staging table, skipping rows whose id already exists
+def import_table(table, in_file, compressed=True):
+    spec = _table(table)
+    columns = ", ".join(spec["columns"])
+    source = gzip.GzipFile(fileobj=in_file, mode="rb") if compressed else in_file
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"CREATE TEMP TABLE import_staging (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        cursor.copy_expert(f"COPY import_staging ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)", source)
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM import_staging ON CONFLICT DO NOTHING"
+        )
+        inserted = cursor.rowcount
+        # Keep SERIAL ids ahead of the imported ones
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        )
+    return inserted
+
+
+# ======================= CLI =======================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk export/import ChatDocs tables with Postgres COPY.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export a table to CSV (gzip by default)")
+    export_parser.add_argument("table", choices=TABLES)
+    export_parser.add_argument("path", help="Output file, '-' for stdout")
+    export_parser.add_argument("--user-id", type=int, help="Only rows belonging to this user")
+    export_parser.add_argument("--no-gzip", action="store_true")
+
+    import_parser = subparsers.add_parser("import", help="Import a CSV export (gzip by default)")
+    import_parser.add_argument("table", choices=TABLES)
+    import_parser.add_argument("path", help="Input file, '-' for stdin")
+    import_parser.add_argument("--no-gzip", action="store_true")
+
+    args = parser.parse_args()
+    compress = not args.no_gzip
+
+    if args.command == "export":
+        if args.path == "-":
+            export_table(args.table, sys.stdout.buffer, args.user_id, compress)
+        else:
+            with open(args.path, "wb") as f:
+                export_table(args.table, f, args.user_id, compress)
+    else:
+        if args.path == "-":
+            count = import_table(args.table, sys.stdin.buffer, compress)
+        else:
+            with open(args.path, "rb") as f:
+                count = import_table(args.table, f, compress)
+        print(f"Imported {count} new rows into {args.table}.", file=sys.stderr)
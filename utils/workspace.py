@@ -0,0 +1,501 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+import faiss
+import numpy as np
+import streamlit as st
+from langchain_core.documents import Document
+from psycopg2.extras import execute_values
+from utils.answer_cache import invalidate_document
+from utils.ann import (build_index, configured_index_type, has_stable_ids, index_type_of, load_store, make_store,
+                       reconstruct_all, reindex_store, unwrap)
+from utils.bm25 import BM25Index, SegmentedBM25, hybrid_search, store_labels, store_texts
+from utils.config import get_setting
+from utils.db import get_connection
+
+
+# ======================= Per-User Document Library =======================
+#
+# Every user gets one persistent FAISS shard under WORKSPACE_DIR/<user_id>/ holding the chunks of
+# all their documents, tagged with `doc_hash`/`doc_name` metadata. Postgres (`documents` table)
+# lists the library; questions can then target one, several or all documents via metadata filters.
+
+# Share of an old document's chunks a same-name upload must keep to count as its new version
+VERSION_MIN_SHARED = 0.5
+
+# HNSW tombstones / BM25 changes since the last full build, as a share of the shard, before that
+# index is rebuilt (a rebuild then pays for ~this many edits instead of every one)
+MAX_PENDING_SHARE = 0.1
+
+
+def _workspace_root():
+    return get_setting("cache", "WORKSPACE_DIR", os.path.join(".cache", "workspaces"))
+
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive lock on `path` shared by every process (the web app and the bulk ingestion CLI)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self):
+        return self._file is not None
+
+    def acquire(self, blocking=True):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock_file = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                while True:
+                    try:
+                        lock_file.seek(0)
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        time.sleep(0.05)
+        except OSError:
+            lock_file.close()
+            if blocking:
+                raise
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if fcntl is None:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()  # Also drops the flock
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class WorkspaceBusy(RuntimeError):
+    """Another process (the bulk ingestion CLI) holds the shard's lock."""
+
+
+def _read_generation(folder):
+    try:
+        with open(os.path.join(folder, "generation"), encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+class Workspace:
+    """One user's shard. Chunks have stable int64 ids (IndexIDMap2 over flat/HNSW, native ids on
+    IVF), so edits add and remove vectors by id instead of renumbering or rebuilding the index.
+    HNSW graphs can't drop nodes, so their deleted labels are tombstoned (skipped at search time)
+    until they reach MAX_PENDING_SHARE of the shard and the graph is compacted. BM25 likewise keeps
+    a small segment for added chunks and a deleted-label set (SegmentedBM25) between full builds.
+
+    Other processes (the bulk ingestion CLI) write the same folder. Every save stamps the folder
+    with a new `generation`; changes happen under a cross-process file lock, after reloading the
+    shard if another process saved it since it was loaded, so nobody saves over someone else's
+    documents. The lock is held from the first unsaved change until the save.
+    """
+
+    def __init__(self, folder, embeddings):
+        self.folder = folder
+        self.embeddings = embeddings
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(f"{folder}.lock")
+        self._load()
+
+    def _load(self):
+        self.store = None
+        self.bm25 = SegmentedBM25()
+        self.tombstones = set()  # Labels still in an HNSW graph whose chunks were deleted
+        self._search_params = None
+        self.next_id = 0
+        self.doc_counts = {}  # doc_hash -> chunks in the shard, kept in step with every change
+        self.generation = _read_generation(self.folder)
+        self._dirty = False
+        if os.path.exists(os.path.join(self.folder, "index.faiss")):
+            self.store = load_store(self.folder, self.embeddings)
+            if not has_stable_ids(self.store.index):
+                # Shards saved before ids were mapped: same labels, wrapped in IndexIDMap2 (lossless)
+                self.store = reindex_store(self.store, index_type_of(self.store.index))
+            live = set(self.store.index_to_docstore_id)
+            labels = live
+            if isinstance(self.store.index, faiss.IndexIDMap):
+                labels = set(faiss.vector_to_array(self.store.index.id_map).tolist())
+                self._set_tombstones(labels - live)
+            self.next_id = max(labels, default=-1) + 1
+            # Chunks added/deleted after the saved BM25 was built go to its segment / deleted set
+            main = BM25Index.load(self.folder)
+            indexed = set(main.labels.tolist()) if main is not None else set()
+            self.bm25 = SegmentedBM25(main, deleted=indexed - live)
+            new_labels = sorted(live - indexed)
+            self.bm25.add(new_labels, [self.store.docstore.search(self.store.index_to_docstore_id[label]).page_content
+                                       for label in new_labels])
+            for doc in self.store.docstore._dict.values():
+                doc_hash = doc.metadata.get("doc_hash")
+                self.doc_counts[doc_hash] = self.doc_counts.get(doc_hash, 0) + 1
+
+    def doc_hashes(self):
+        return set(self.doc_counts)
+
+    def _count(self, doc_hash, delta):
+        count = self.doc_counts.get(doc_hash, 0) + delta
+        if count > 0:
+            self.doc_counts[doc_hash] = count
+        else:
+            self.doc_counts.pop(doc_hash, None)
+
+    # 🔹 Pick up a save made by another process; if the CLI holds the lock, keep serving this copy
+    def refresh(self):
+        if _read_generation(self.folder) == self.generation:
+            return self
+        with self._lock:
+            if not self._file_lock.held and self._file_lock.acquire(blocking=False):
+                try:
+                    if _read_generation(self.folder) != self.generation:
+                        self._load()
+                finally:
+                    self._file_lock.release()
+        return self
+
+    @contextmanager
+    def _mutation(self, save=True, wait=True):
+        """Lock the shard across processes for a change, saving (and unlocking) at the end unless
+        `save` is False; the lock is then kept until a later change or save() writes it out.
+        With wait=False, raises WorkspaceBusy instead of waiting for another process's lock."""
+        with self._lock:
+            if not self._file_lock.held:
+                if not self._file_lock.acquire(blocking=wait):
+                    raise WorkspaceBusy(f"{self.folder} is locked by another process")
+                if _read_generation(self.folder) != self.generation:
+                    self._load()
+            try:
+                yield
+                if save and self._dirty:
+                    self._save()
+            except BaseException:
+                self._load()  # Drop the half-applied change
+                self._file_lock.release()
+                raise
+            if save:
+                self._file_lock.release()
+
+    # 🔹 Write out changes made with save=False
+    def save(self):
+        with self._mutation():
+            pass
+
+    def _save(self):
+        tmp_folder = f"{self.folder}.tmp-{os.getpid()}-{time.time_ns()}"
+        self.store.save_local(tmp_folder)
+        if self.bm25.main is not None:
+            self.bm25.main.save(tmp_folder)  # The segment and deleted set are derived again on load
+        generation = uuid.uuid4().hex
+        with open(os.path.join(tmp_folder, "generation"), "w", encoding="utf-8") as f:
+            f.write(generation)
+        # Swap the folder in; a reader sees either the old or the new index
+        old_folder = f"{self.folder}.old-{time.time_ns()}"
+        if os.path.exists(self.folder):
+            os.rename(self.folder, old_folder)
+        os.rename(tmp_folder, self.folder)
+        shutil.rmtree(old_folder, ignore_errors=True)
+        self.generation = generation
+        self._dirty = False
+
+    def _set_tombstones(self, tombstones):
+        self.tombstones = tombstones
+        self._search_params = None
+        if tombstones:
+            unwanted = faiss.IDSelectorBatch(np.fromiter(tombstones, dtype=np.int64, count=len(tombstones)))
+            selector = faiss.IDSelectorNot(unwanted)
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=unwrap(self.store.index).hnsw.efSearch)
+            params._selectors = (unwanted, selector)  # The params only hold raw pointers to these
+            self._search_params = params
+
+    def _live_count(self):
+        return len(self.store.index_to_docstore_id)
+
+    def _keyword_index(self):
+        if self.store is not None and self._needs_bm25_rebuild():
+            with self._lock:
+                if self._needs_bm25_rebuild():
+                    labels = store_labels(self.store)
+                    texts = [self.store.docstore.search(self.store.index_to_docstore_id[label]).page_content for label in labels]
+                    bm25 = BM25Index.build(texts, labels)
+                    # Only into the folder this copy was loaded from, and never while another
+                    # process is changing it; otherwise the next load builds it again
+                    if not self._file_lock.held and self._file_lock.acquire(blocking=False):
+                        try:
+                            if _read_generation(self.folder) == self.generation:
+                                bm25.save(self.folder)
+                        finally:
+                            self._file_lock.release()
+                    self.bm25 = SegmentedBM25(bm25)
+        return self.bm25
+
+    def _needs_bm25_rebuild(self):
+        return self.bm25.main is None or self.bm25.pending > MAX_PENDING_SHARE * self._live_count()
+
+    # 🔹 Copy a document's chunks (from its own index) into the user's shard, once
+    def add_document(self, doc_hash, doc_name, vector_store, wait=True):
+        entry = (doc_hash, doc_name, store_texts(vector_store), reconstruct_all(vector_store.index))
+        return bool(self.add_documents([entry], wait=wait))
+
+    # 🔹 Add many (doc_hash, doc_name, texts, vectors) at once with a single save, skipping known documents.
+    #    With save=False the changes stay in memory (and the shard locked) until save() or a later save.
+    def add_documents(self, entries, save=True, wait=True):
+        with self._mutation(save, wait):
+            known = self.doc_hashes()
+            added = []
+            for doc_hash, doc_name, texts, vectors in entries:
+                if doc_hash in known or not texts:
+                    continue
+                known.add(doc_hash)
+                self._add_chunks(doc_hash, doc_name, list(enumerate(texts)), vectors)
+                added.append(doc_hash)
+            if added:
+                self._maybe_reindex()
+        return added
+
+    def _add_chunks(self, doc_hash, doc_name, numbered_texts, vectors):
+        # `chunk` keeps the order within the document, ids don't once a new version is diffed in
+        docs = [Document(page_content=text, metadata={"doc_hash": doc_hash, "doc_name": doc_name, "chunk": number})
+                for number, text in numbered_texts]
+        vectors = np.array(vectors, dtype=np.float32).reshape(len(docs), -1)
+        faiss.normalize_L2(vectors)
+        labels = np.arange(self.next_id, self.next_id + len(docs), dtype=np.int64)
+        self.next_id += len(docs)
+        if self.store is None:
+            index = build_index(vectors, configured_index_type(len(docs)), ids=labels)
+            self.store = make_store(self.embeddings, index, docs, labels)
+        else:
+            self.store.index.add_with_ids(vectors, labels)
+            doc_ids = [str(label) for label in labels.tolist()]
+            self.store.docstore.add(dict(zip(doc_ids, docs)))
+            self.store.index_to_docstore_id.update(zip(labels.tolist(), doc_ids))
+        self.bm25.add(labels.tolist(), [doc.page_content for doc in docs])
+        self._count(doc_hash, len(docs))
+        self._dirty = True
+
+    def _delete_labels(self, labels):
+        for label in labels:
+            doc_id = self.store.index_to_docstore_id[label]
+            self._count(self.store.docstore.search(doc_id).metadata.get("doc_hash"), -1)
+        if index_type_of(self.store.index) == "hnsw":
+            # HNSW graphs can't drop nodes: the vectors stay as tombstones until _maybe_reindex compacts
+            self._set_tombstones(self.tombstones | set(labels))
+        else:
+            self.store.index.remove_ids(np.asarray(labels, dtype=np.int64))
+        self.store.docstore.delete([self.store.index_to_docstore_id.pop(label) for label in labels])
+        self.bm25.delete(labels)
+
+    # 🔹 Swap in a new version of a document: chunks whose text is unchanged keep their vectors and are
+    #    relabelled, only added/edited chunks are inserted and only dropped ones are deleted by id
+    def replace_document(self, old_hash, new_hash, doc_name, vector_store, min_shared=VERSION_MIN_SHARED, wait=True):
+        """Returns (kept, added, removed) chunk counts, or None (and changes nothing) if fewer than
+        `min_shared` of the old document's chunks are still in the new one: that's a different
+        document that happens to have the same name, not a new version."""
+        new_texts = store_texts(vector_store)
+        with self._mutation(wait=wait):
+            old_labels = {}
+            if self.store is not None:
+                for label in store_labels(self.store):
+                    doc = self.store.docstore.search(self.store.index_to_docstore_id[label])
+                    if doc.metadata.get("doc_hash") == old_hash:
+                        old_labels.setdefault(doc.page_content, []).append(label)
+
+            old_total = sum(len(labels) for labels in old_labels.values())
+            shared = sum(min(count, len(old_labels.get(text, ()))) for text, count in Counter(new_texts).items())
+            if shared < min_shared * old_total:
+                return None
+
+            kept, added = 0, []
+            for number, text in enumerate(new_texts):
+                if old_labels.get(text):
+                    label = old_labels[text].pop(0)
+                    doc = self.store.docstore.search(self.store.index_to_docstore_id[label])
+                    doc.metadata.update(doc_hash=new_hash, doc_name=doc_name, chunk=number)
+                    self._count(old_hash, -1)
+                    self._count(new_hash, 1)
+                    kept += 1
+                else:
+                    added.append((number, text))
+
+            removed = [label for labels in old_labels.values() for label in labels]
+            if removed:
+                self._delete_labels(removed)
+            if added:
+                # Vectors of the new chunks come from the new version's own index, nothing is re-embedded
+                vectors = reconstruct_all(vector_store.index)[[number for number, _ in added]]
+                self._add_chunks(new_hash, doc_name, added, vectors)
+            self._dirty = True
+            self._maybe_reindex()
+        return kept, len(added), len(removed)
+
+    # 🔹 Switch flat -> HNSW/IVF (see utils/ann.py) once the shard grows past the size thresholds, and
+    #    compact an HNSW graph whose tombstones passed MAX_PENDING_SHARE. An ivf_pq shard stays as it
+    #    is: its codes are lossy and it handles adds/removes by id anyway.
+    def _maybe_reindex(self):
+        current = index_type_of(self.store.index)
+        wanted = configured_index_type(self._live_count())
+        if current == "ivf_pq":
+            return
+        if wanted != current or len(self.tombstones) > MAX_PENDING_SHARE * self._live_count():
+            self.store = reindex_store(self.store, wanted)  # Live labels only
+            self._set_tombstones(set())
+
+    # 🔹 Chunk texts of one document in the order they were added (for whole-document summaries)
+    def document_texts(self, doc_hash):
+        if self.store is None:
+            return []
+        chunks = []
+        for position, doc_id in self.store.index_to_docstore_id.items():
+            doc = self.store.docstore.search(doc_id)
+            if doc.metadata.get("doc_hash") == doc_hash:
+                chunks.append((doc.metadata.get("chunk", position), doc.page_content))
+        return [text for _, text in sorted(chunks)]
+
+    # 🔹 Hybrid (dense + BM25) search, optionally limited to some of the user's documents
+    def similarity_search(self, question, doc_hashes=None, k=3, with_positions=False, query_vector=None):
+        if self.store is None:
+            return []
+        if not doc_hashes:
+            return hybrid_search(self.store, self._keyword_index(), question, k=k, with_positions=with_positions,
+                                 search_params=self._search_params, query_vector=query_vector)
+        wanted = set(doc_hashes)
+        total = self._live_count()
+        selected = sum(self.doc_counts.get(doc_hash, 0) for doc_hash in wanted)
+        if not selected:
+            return []
+        # Over-fetch in proportion to how small the selection is, then widen until the metadata
+        # filter leaves k results (or every chunk has been considered)
+        fetch_k = min(total, max(50, 10 * k, 2 * k * total // selected))
+        if query_vector is None:
+            query_vector = self.store._embed_query(question)  # Once, not per widening step
+        while True:
+            results = hybrid_search(self.store, self._keyword_index(), question, k=k, fetch_k=fetch_k,
+                                    doc_filter=lambda doc: doc.metadata.get("doc_hash") in wanted,
+                                    with_positions=with_positions, search_params=self._search_params,
+                                    query_vector=query_vector)
+            if len(results) >= min(k, selected) or fetch_k >= total:
+                return results
+            fetch_k = min(total, fetch_k * 4)
+
+
+# 🔹 One loaded shard per user per process, reloaded when another process has saved it since
+@st.cache_resource(max_entries=64)
+def _load_workspace(user_id, _embeddings):
+    return Workspace(os.path.join(_workspace_root(), str(user_id)), _embeddings)
+
+
+def get_workspace(user_id, embeddings):
+    return _load_workspace(user_id, embeddings).refresh()
+
+
+def delete_workspace(user_id):
+    _load_workspace.clear()
+    folder = os.path.join(_workspace_root(), str(user_id))
+    with FileLock(f"{folder}.lock"):
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+# ======================= Library Metadata (Postgres) =======================
+
+# 🔹 `replaces` marks the previous version superseded; the new row continues its version number
+def record_document(user_id, doc_hash, name, chunk_count, replaces=None):
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO documents (user_id, doc_hash, name, chunk_count, version, replaces)
+            VALUES (%s, %s, %s, %s,
+                    COALESCE((SELECT version + 1 FROM documents WHERE user_id = %s AND doc_hash = %s), 1), %s)
+            ON CONFLICT (user_id, doc_hash) DO UPDATE SET name = EXCLUDED.name, superseded_by = NULL
+            """,
+            (user_id, doc_hash, name, chunk_count, user_id, replaces, replaces),
+        )
+        if replaces:
+            cursor.execute(
+                "UPDATE documents SET superseded_by = %s WHERE user_id = %s AND doc_hash = %s",
+                (doc_hash, user_id, replaces),
+            )
+
+
+# 🔹 Batch version for bulk loads: rows are (doc_hash, name, chunk_count)
+def record_documents(user_id, rows):
+    with get_connection() as conn, conn.cursor() as cursor:
+        execute_values(
+            cursor,
+            """
+            INSERT INTO documents (user_id, doc_hash, name, chunk_count) VALUES %s
+            ON CONFLICT (user_id, doc_hash) DO UPDATE SET name = EXCLUDED.name
+            """,
+            [(user_id, doc_hash, name, chunk_count) for doc_hash, name, chunk_count in rows],
+        )
+
+
+def superseded_documents(user_id):
+    """Hashes of the user's documents that were replaced by a newer version."""
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT doc_hash FROM documents WHERE user_id = %s AND superseded_by IS NOT NULL", (user_id,))
+        return {row[0] for row in cursor.fetchall()}
+
+
+# 🔹 Put a document into the user's library. One with the same name as a library document is its new
+#    version if it still shares most of its chunks: only the changed chunks are swapped in. Otherwise
+#    it's added as a separate document. Used from page requests, so it doesn't wait for a bulk load's lock
+def add_to_library(workspace, user_id, library, doc_hash, name, vector_store):
+    """library: {doc_hash: name}, newest first. Returns (updated library, (kept, added, removed) or None).
+
+    Raises WorkspaceBusy while the bulk ingestion CLI is loading into the same library.
+    """
+    previous_version = next((known for known, known_name in library.items() if known_name == name and known != doc_hash), None)
+    changes = None
+    if previous_version is not None:
+        changes = workspace.replace_document(previous_version, doc_hash, name, vector_store, wait=False)
+    if changes is None:
+        previous_version = None
+        workspace.add_document(doc_hash, name, vector_store, wait=False)
+    record_document(user_id, doc_hash, name, vector_store.index.ntotal, previous_version)
+    if previous_version is not None:
+        invalidate_document(previous_version)
+    library = {doc_hash: name, **{known: known_name for known, known_name in library.items() if known != previous_version}}
+    return library, changes
+
+
+def list_documents(user_id):
+    """Returns {doc_hash: name} for the user's library (latest versions only), newest first."""
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT doc_hash, name FROM documents WHERE user_id = %s AND superseded_by IS NULL ORDER BY created_at DESC",
+            (user_id,),
+        )
+        return dict(cursor.fetchall())
+
+
+# 🔹 Cache key for a set of documents (answer/semantic caches work per selection)
+def scope_key(doc_hashes):
+    if len(doc_hashes) == 1:
+        return next(iter(doc_hashes))
+    return hashlib.sha256("|".join(sorted(doc_hashes)).encode("utf-8")).hexdigest()